@@ -0,0 +1,36 @@
+from django.apps import AppConfig, apps
+from django.conf import settings
+
+from django_json_schema_editor.forms import LABELS_CACHE, cache_labels_of
+from django_json_schema_editor.validation import warm_up
+
+
+def referenced_models():
+    """
+    Yield the models referenced by JSON fields and JSON plugins
+    """
+    for model in apps.get_models():
+        for field in model._meta.local_fields:
+            for to, _getter in getattr(field, "_references", ()):
+                yield to
+            for label, _getter in getattr(field, "_foreign_key_descriptions", ()):
+                yield apps.get_model(label)
+        for paths in model.__dict__.get("_proxy_types_foreign_key_paths", {}).values():
+            for label in paths:
+                yield apps.get_model(label)
+        if model.__dict__.get("_schema_foreign_keys"):
+            for label in model._get_foreign_key_extractors():
+                yield apps.get_model(label)
+
+
+class JSONSchemaEditorConfig(AppConfig):
+    name = "django_json_schema_editor"
+    verbose_name = "JSON Schema Editor"
+
+    def ready(self):
+        if getattr(settings, "JSONEDITORWIDGET_VALIDATOR_WARM_UP", False):
+            warm_up()
+
+        if LABELS_CACHE:
+            for model in referenced_models():
+                cache_labels_of(model)
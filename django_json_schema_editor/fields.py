@@ -1,72 +1,313 @@
-from functools import partial
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import cache, partial
+from itertools import islice
+from weakref import WeakValueDictionary
 
 import jmespath
+from django.apps import apps
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError, models
-from django.db.models import Q, signals
+from django.db import models, transaction
+from django.db.models import signals
+from django.db.models.query_utils import DeferredAttribute
 from django.utils.translation import gettext as _
 
 from django_json_schema_editor.forms import JSONEditorField
+from django_json_schema_editor.validation import json_fingerprint, schema_fingerprint
+
+
+# Maps model classes to the listeners which have to run when their instances
+# are saved. Contains the models references have been registered on and all
+# their subclasses including proxies, so that ``post_save`` receivers can be
+# connected per sender instead of running for every model in the project.
+_reference_listeners = {}
+# Maps the models references have been registered on to their listeners
+_registered_listeners = {}
+# Maps the models references have been registered on to their through models,
+# target models and getters
+_registered_references = {}
+
+
+def _json_fingerprints(instance, exclude=()):
+    return {
+        field.attname: json_fingerprint(instance.__dict__[field.attname])
+        for field in instance._meta.concrete_fields
+        if isinstance(field, JSONField)
+        and field.attname in instance.__dict__
+        and field.attname not in exclude
+    }
 
 
-def _register_reference(jsonmodel, to, *, name, getter, field=None):
-    class Meta:
-        verbose_name = f"{jsonmodel.__name__} ⇒ {to.__name__} reference"
+@cache
+def _json_attnames(model):
+    return frozenset(
+        field.attname
+        for field in model._meta.concrete_fields
+        if isinstance(field, JSONField)
+    )
 
-    ns = {
-        "__module__": jsonmodel.__module__,
-        "parent": models.ForeignKey(
-            jsonmodel, on_delete=models.CASCADE, related_name="+"
-        ),
-        "object": models.ForeignKey(to, on_delete=models.PROTECT, related_name="+"),
-        "Meta": Meta,
-        "__str__": lambda obj: str(obj.parent),
-    }
 
-    reference = type(
-        f"{jsonmodel._meta.model_name}_{to._meta.label_lower.replace('.', '_')}_ref",
-        (models.Model,),
-        ns,
+def snapshot_json_fields(instance):
+    """
+    Remember fingerprints of the JSON field values of an instance
+
+    Call this when loading instances from the database (``Model.from_db``);
+    saving and validating instances whose JSON data hasn't changed since then
+    skips the reference synchronization and validation. The fingerprint of a
+    value is only taken when the value is first accessed, values which are
+    never accessed cannot have changed. Instances of models without registered
+    references are left alone.
+    """
+    if type(instance) in _reference_listeners:
+        instance._json_fingerprints = {}
+        instance._json_unread = (
+            _json_attnames(type(instance)) & instance.__dict__.keys()
+        )
+
+
+def _json_field_changed(instance, field):
+    if field.attname in instance.__dict__.get("_json_unread", ()):
+        return False
+    if (fingerprints := instance.__dict__.get("_json_fingerprints")) is None or (
+        field.attname not in fingerprints
+    ):
+        return True
+    return (
+        json_fingerprint(instance.__dict__[field.attname])
+        != fingerprints[field.attname]
     )
 
-    def listener(sender, instance, **kwargs):
-        if not isinstance(instance, jsonmodel):
-            return
 
-        if (data := getter(instance)) is None or not isinstance(data, list):
-            return
+class _JSONFieldDescriptor(DeferredAttribute):
+    """
+    Takes the fingerprint of values loaded from the database when they are
+    first accessed or replaced, before they can be modified
+    """
+
+    def _snapshot(self, instance, value):
+        attname = self.field.attname
+        instance._json_unread = instance._json_unread - {attname}
+        instance._json_fingerprints = instance._json_fingerprints | {
+            attname: json_fingerprint(value)
+        }
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if self.field.attname in instance.__dict__.get("_json_unread", ()):
+            self._snapshot(instance, value)
+        return value
+
+    def __set__(self, instance, value):
+        attname = self.field.attname
+        if attname in instance.__dict__.get("_json_unread", ()):
+            self._snapshot(instance, instance.__dict__[attname])
+        instance.__dict__[attname] = value
+
+
+def _dispatch_post_save(sender, instance, created, update_fields, using, **kwargs):
+    if not (listeners := _reference_listeners.get(sender)):
+        return
+
+    snapshot = instance.__dict__.get("_json_fingerprints")
+    previous = {} if created or snapshot is None else snapshot
+    # Values which haven't been accessed since loading haven't changed
+    unread = () if created else instance.__dict__.get("_json_unread", ())
+    fingerprints = {
+        attname: fingerprint
+        for attname, fingerprint in _json_fingerprints(instance, unread).items()
+        if update_fields is None or attname in update_fields
+    }
+    changed = {
+        attname
+        for attname, fingerprint in fingerprints.items()
+        if previous.get(attname) != fingerprint
+    }
+    for listener in listeners:
+        listener(instance, changed=changed, using=using)
+    # Only instances loaded from the database carry a snapshot
+    if snapshot is not None:
+        instance._json_fingerprints = previous | fingerprints
+        instance._json_unread = instance._json_unread - fingerprints.keys()
+
+
+def _add_reference_listener(cls, listener):
+    if cls not in _reference_listeners:
+        _reference_listeners[cls] = []
+        signals.post_save.connect(_dispatch_post_save, sender=cls, weak=False)
+        # Only models with references pay for tracking the accesses
+        for field in cls._meta.concrete_fields:
+            if isinstance(field, JSONField) and not isinstance(
+                cls.__dict__.get(field.attname), _JSONFieldDescriptor
+            ):
+                setattr(cls, field.attname, _JSONFieldDescriptor(field))
+    _reference_listeners[cls].append(listener)
+
+
+def _connect_reference_listener(jsonmodel, listener):
+    _registered_listeners.setdefault(jsonmodel, []).append(listener)
+
+    subclasses = [jsonmodel]
+    while subclasses:
+        cls = subclasses.pop()
+        _add_reference_listener(cls, listener)
+        subclasses.extend(cls.__subclasses__())
+
+
+def _class_prepared(sender, **kwargs):
+    # Subclasses and proxies created after registering references
+    for jsonmodel, listeners in _registered_listeners.items():
+        if sender is not jsonmodel and issubclass(sender, jsonmodel):
+            for listener in listeners:
+                _add_reference_listener(sender, listener)
+
+
+signals.class_prepared.connect(_class_prepared)
+
 
-        pks = [pk for pk in data if pk]
-        valid_pks = []
-        for pk in pks:
+def _sync_references(reference, to, getter, instances):
+    """
+    Synchronize the through model rows of all instances with their data
+
+    Runs a constant number of queries independent of the number of instances
+    and referenced primary keys.
+    """
+    wanted = {}
+    for instance in instances:
+        if (data := getter(instance)) is None or not isinstance(data, list):
+            continue
+        pks = set()
+        for pk in data:
+            if not pk:
+                continue
+            # Skip primary keys that can't be processed by the database
             try:
-                reference.objects.update_or_create(parent=instance, object_id=pk)
-                valid_pks.append(pk)
-            except (ValueError, TypeError, IntegrityError):
-                # Skip primary keys that can't be processed by the database
+                pks.add(to._meta.pk.to_python(pk))
+            except (ValidationError, ValueError, TypeError):
                 pass
+        wanted[instance.pk] = pks
 
-        # Only try to delete references for valid PKs to avoid database errors
-        q = Q(parent=instance)
-        if valid_pks:
-            q &= ~Q(object_id__in=valid_pks)
-        reference.objects.filter(q).delete()
+    if not wanted:
+        return
 
-    # This doesn't work because we're using proxy models:
-    # signals.post_save.connect(listener, sender=jsonmodel, weak=False)
-    signals.post_save.connect(listener, weak=False)
+    if candidates := set().union(*wanted.values()):
+        # Skip primary keys of objects which do not exist
+        existing_objects = set(
+            to._base_manager.filter(pk__in=candidates).values_list("pk", flat=True)
+        )
+        wanted = {parent: pks & existing_objects for parent, pks in wanted.items()}
+
+    existing = {}
+    stale = []
+    for id, parent_id, object_id in reference.objects.filter(
+        parent__in=wanted
+    ).values_list("id", "parent_id", "object_id"):
+        if object_id in wanted[parent_id]:
+            existing.setdefault(parent_id, set()).add(object_id)
+        else:
+            stale.append(id)
 
-    models.ManyToManyField(to, editable=False, through=reference).contribute_to_class(
-        jsonmodel, name
-    )
+    if stale:
+        reference.objects.filter(pk__in=stale).delete()
+
+    if missing := [
+        reference(parent_id=parent, object_id=pk)
+        for parent, pks in wanted.items()
+        for pk in pks - existing.get(parent, set())
+    ]:
+        reference.objects.bulk_create(missing)
 
-    def validate(instance):
-        if (data := getter(instance)) is None or not isinstance(data, list):
-            return
 
-        pks = []
-        invalid = []
+def sync_references(queryset, *, batch_size=1000):
+    """
+    Synchronize the references of all instances of the queryset
+
+    ``bulk_create``, ``bulk_update`` and ``QuerySet.update`` do not send the
+    ``post_save`` signal, so references have to be synchronized explicitly
+    after using them. Instances are processed in batches of ``batch_size``,
+    each batch runs a constant number of queries per through model.
+
+    Returns the number of processed instances.
+    """
+    references = [
+        reference
+        for jsonmodel, references in _registered_references.items()
+        if issubclass(queryset.model, jsonmodel)
+        for reference in references
+    ]
+    if not references:
+        return 0
 
+    count = 0
+    instances = queryset.iterator(chunk_size=batch_size)
+    while batch := list(islice(instances, batch_size)):
+        for reference, to, getter in references:
+            _sync_references(reference, to, getter, batch)
+        count += len(batch)
+    return count
+
+
+class _DeferredReferenceSync:
+    """
+    ``on_commit`` callback synchronizing the references of queued instances
+
+    The primary keys of the instances are queued per through model; each
+    through model is synchronized with one bulk diff using the committed data
+    when the transaction is committed.
+    """
+
+    def __init__(self, using):
+        self.using = using
+        self.queue = {}
+        self.executed = False
+
+    def add(self, reference, to, getter, instance):
+        self.queue.setdefault(reference, (to, getter, set()))[2].add(instance.pk)
+
+    def __call__(self):
+        self.executed = True
+        for reference, (to, getter, pks) in self.queue.items():
+            # Instances which have been deleted in the meantime are skipped
+            parent = reference._meta.get_field("parent").related_model
+            _sync_references(
+                reference,
+                to,
+                getter,
+                list(parent._base_manager.using(self.using).filter(pk__in=pks)),
+            )
+
+
+# Pending callbacks per database connection. Django drops the callbacks of
+# rolled back transactions and savepoints, which removes them from here too, so
+# that the next deferred synchronization registers a new callback.
+_pending_syncs = WeakValueDictionary()
+
+
+def _defer_sync_references(reference, to, getter, instance, using):
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        _sync_references(reference, to, getter, [instance])
+        return
+
+    func = _pending_syncs.get(connection)
+    if func is None or func.executed:
+        func = _pending_syncs[connection] = _DeferredReferenceSync(connection.alias)
+        transaction.on_commit(func, using=connection.alias)
+    func.add(reference, to, getter, instance)
+
+
+def _reference_candidates(instance, references):
+    """
+    Return the convertible and the unconvertible primary keys per target model
+    """
+    candidates = {}
+    for to, getter in references:
+        if (data := getter(instance)) is None or not isinstance(data, list):
+            continue
+
+        pks, invalid = candidates.setdefault(to, (set(), []))
         for pk in data:
             # Primary key is unset (falsy), this is fine
             if not pk:
@@ -74,24 +315,123 @@ def _register_reference(jsonmodel, to, *, name, getter, field=None):
 
             # Primary key is not convertible to its Python equivalent
             try:
-                pks.append(to._meta.pk.to_python(pk))
+                pks.add(to._meta.pk.to_python(pk))
             except Exception:
                 invalid.append(pk)
+    return candidates
+
 
-        if not invalid and pks:
-            objects = to._base_manager.filter(pk__in=pks)
-            if len(objects) != len(pks):
-                found = {obj.pk for obj in objects}
-                invalid = [pk for pk in pks if pk not in found]
-
-        if invalid:
-            raise ValidationError(
-                _("Some of the references are invalid: {}").format(
-                    ", ".join(map(str, invalid))
-                )
+class ReferenceValidation:
+    """
+    Batches the existence checks of reference validation
+
+    Candidate primary keys of many instances are collected using ``add`` before
+    validating them; the first validation then checks all collected primary
+    keys with one query per target model. Activate it using
+    ``batch_reference_validation()``.
+    """
+
+    def __init__(self):
+        self.candidates = defaultdict(set)
+        self.checked = defaultdict(set)
+        self.existing = defaultdict(set)
+
+    def add(self, instance):
+        for field in instance._meta.concrete_fields:
+            if isinstance(field, JSONField) and field._references:
+                for to, (pks, _invalid) in _reference_candidates(
+                    instance, field._references
+                ).items():
+                    self.candidates[to] |= pks
+
+    def filter_existing(self, to, pks):
+        if unchecked := (self.candidates[to] | pks) - self.checked[to]:
+            self.existing[to].update(
+                to._base_manager.filter(pk__in=unchecked).values_list("pk", flat=True)
+            )
+            self.checked[to] |= unchecked
+        return pks & self.existing[to]
+
+
+_reference_validation = ContextVar("reference_validation", default=None)
+
+
+@contextmanager
+def batch_reference_validation():
+    """
+    Batch the reference validation of all instances validated in this block
+    """
+    if (validation := _reference_validation.get()) is not None:
+        # Already batching
+        yield validation
+        return
+
+    token = _reference_validation.set(validation := ReferenceValidation())
+    try:
+        yield validation
+    finally:
+        _reference_validation.reset(token)
+
+
+def _validate_references(instance, references):
+    validation = _reference_validation.get()
+    invalid = []
+    for to, (pks, unconvertible) in _reference_candidates(instance, references).items():
+        invalid.extend(pk for pk in unconvertible if pk not in invalid)
+        if not pks:
+            continue
+        if validation is None:
+            existing = set(
+                to._base_manager.filter(pk__in=pks).values_list("pk", flat=True)
             )
+        else:
+            existing = validation.filter_existing(to, pks)
+        invalid.extend(sorted(pks - existing, key=str))
+
+    if invalid:
+        raise ValidationError(
+            _("Some of the references are invalid: {}").format(
+                ", ".join(map(str, invalid))
+            )
+        )
+
+
+def _register_reference(jsonmodel, to, *, name, getter, field=None, deferred=False):
+    class Meta:
+        verbose_name = f"{jsonmodel.__name__} ⇒ {to.__name__} reference"
+
+    ns = {
+        "__module__": jsonmodel.__module__,
+        "parent": models.ForeignKey(
+            jsonmodel, on_delete=models.CASCADE, related_name="+"
+        ),
+        "object": models.ForeignKey(to, on_delete=models.PROTECT, related_name="+"),
+        "Meta": Meta,
+        "__str__": lambda obj: str(obj.parent),
+    }
+
+    reference = type(
+        f"{jsonmodel._meta.model_name}_{to._meta.label_lower.replace('.', '_')}_ref",
+        (models.Model,),
+        ns,
+    )
+
+    def listener(instance, *, changed, using):
+        if field.attname not in changed:
+            return
+        if deferred:
+            _defer_sync_references(reference, to, getter, instance, using)
+        else:
+            _sync_references(reference, to, getter, [instance])
+
+    _connect_reference_listener(jsonmodel, listener)
 
-    field._reference_validators.append(validate)
+    models.ManyToManyField(to, editable=False, through=reference).contribute_to_class(
+        jsonmodel, name
+    )
+
+    field._references.append((to, getter))
+    _registered_references.setdefault(jsonmodel, []).append((reference, to, getter))
 
 
 class JSONField(models.JSONField):
@@ -99,7 +439,8 @@ class JSONField(models.JSONField):
         self._config = kwargs.pop("config", None)
         self._schema = kwargs.pop("schema", None)
         self._foreign_key_descriptions = kwargs.pop("foreign_key_descriptions", [])
-        self._reference_validators = []
+        self._patch = kwargs.pop("patch", False)
+        self._references = []
         super().__init__(*args, **kwargs)
 
     def deconstruct(self):
@@ -114,10 +455,17 @@ class JSONField(models.JSONField):
                 config=self._config,
                 schema=self._schema,
                 foreign_key_descriptions=self._foreign_key_descriptions,
+                patch=self._patch,
             ),
         )
         return super().formfield(**kwargs)
 
+    def pre_save(self, model_instance, add):
+        # Saving an unchanged value doesn't need its fingerprint
+        if self.attname in model_instance.__dict__:
+            return model_instance.__dict__[self.attname]
+        return super().pre_save(model_instance, add)
+
     def contribute_to_class(self, cls, name, **kwargs):
         super().contribute_to_class(cls, name, **kwargs)
         setattr(
@@ -128,8 +476,8 @@ class JSONField(models.JSONField):
 
     def validate(self, value, model_instance):
         super().validate(value, model_instance)
-        for validator in self._reference_validators:
-            validator(model_instance)
+        if self._references and _json_field_changed(model_instance, self):
+            _validate_references(model_instance, self._references)
 
 
 def flatten(lst):
@@ -145,6 +493,17 @@ def flatten(lst):
     return result
 
 
+@cache
+def compile_path(path):
+    """
+    Compile the JMESPath expression, parsing each distinct expression only once
+
+    Unlike jmespath's own small cache of parsed expressions this cache doesn't
+    thrash when many expressions are in use.
+    """
+    return jmespath.compile(path)
+
+
 def paths_to_pks(data, *, to, paths):
     """
     Converts a list of JMES paths to a list of primary key values
@@ -154,12 +513,193 @@ def paths_to_pks(data, *, to, paths):
     - ``to``: The Django model instance or class, used to access the primary
       key field's ``to_python`` method
     - ``data``: The data dictionary
-    - ``paths``: A list of JMES paths
+    - ``paths``: A list of JMES paths, either strings or compiled expressions
 
     The returned array is automatically flattened.
     """
     return [
         value
-        for value in flatten([jmespath.search(path, data) for path in paths])
+        for value in flatten(
+            [
+                (compile_path(path) if isinstance(path, str) else path).search(data)
+                for path in paths
+            ]
+        )
         if value
     ]
+
+
+def _extract_value(value, out):
+    if value and not isinstance(value, (dict, list)):
+        out.append(value)
+
+
+def _extract_property(key, extractor):
+    def extract(value, out):
+        if isinstance(value, dict) and key in value:
+            extractor(value[key], out)
+
+    return extract
+
+
+def _extract_additional_properties(known, extractor):
+    def extract(value, out):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if key not in known:
+                    extractor(item, out)
+
+    return extract
+
+
+def _extract_items(extractor):
+    def extract(value, out):
+        if isinstance(value, list):
+            for item in value:
+                extractor(item, out)
+
+    return extract
+
+
+def _extract_item(index, extractor):
+    def extract(value, out):
+        if isinstance(value, list) and index < len(value):
+            extractor(value[index], out)
+
+    return extract
+
+
+def _extract_all(extractors):
+    def extract(value, out):
+        for extractor in extractors:
+            extractor(value, out)
+
+    return extract
+
+
+class _ExtractorCompiler:
+    """
+    Compiles a schema into a function extracting the primary keys of one model
+
+    The function only visits the parts of the data which may contain foreign
+    keys to the model according to the schema.
+    """
+
+    def __init__(self, root, label):
+        self.root = root
+        self.label = label
+        self.refs = {}
+        self.compiling = set()
+
+    def compile_ref(self, ref):
+        if ref in self.refs:
+            return self.refs[ref]
+        if ref in self.compiling:
+            # Recursive schema, look up the extractor when it's needed
+            return lambda value, out: (
+                (extractor := self.refs.get(ref)) and extractor(value, out)
+            )
+        if not ref.startswith("#/"):
+            return None
+
+        target = self.root
+        for token in ref[2:].split("/"):
+            if not isinstance(target, dict):
+                return None
+            target = target.get(token.replace("~1", "/").replace("~0", "~"))
+
+        self.compiling.add(ref)
+        self.refs[ref] = self.compile(target)
+        self.compiling.discard(ref)
+        return self.refs[ref]
+
+    def compile(self, schema):
+        if not isinstance(schema, dict):
+            return None
+
+        extractors = []
+        if ref := schema.get("$ref"):
+            extractors.append(self.compile_ref(ref))
+
+        if (
+            schema.get("format") == "foreign_key"
+            and str((schema.get("options") or {}).get("model", "")).lower()
+            == self.label
+        ):
+            extractors.append(_extract_value)
+
+        properties = schema.get("properties") or {}
+        for key, subschema in properties.items():
+            if extractor := self.compile(subschema):
+                extractors.append(_extract_property(key, extractor))
+        if extractor := self.compile(schema.get("additionalProperties")):
+            extractors.append(_extract_additional_properties(properties, extractor))
+
+        items = schema.get("items")
+        if isinstance(items, list):
+            for index, subschema in enumerate(items):
+                if extractor := self.compile(subschema):
+                    extractors.append(_extract_item(index, extractor))
+        elif extractor := self.compile(items):
+            extractors.append(_extract_items(extractor))
+
+        # Subschemas applying to the same value
+        for keyword in ("allOf", "anyOf", "oneOf"):
+            for subschema in schema.get(keyword) or ():
+                extractors.append(self.compile(subschema))
+        for keyword in ("then", "else"):
+            extractors.append(self.compile(schema.get(keyword)))
+
+        extractors = [extractor for extractor in extractors if extractor]
+        if len(extractors) > 1:
+            return _extract_all(extractors)
+        return extractors[0] if extractors else None
+
+
+def _foreign_key_models(schema, labels):
+    if isinstance(schema, dict):
+        if schema.get("format") == "foreign_key" and (
+            model := (schema.get("options") or {}).get("model")
+        ):
+            labels.add(str(model).lower())
+        schema = list(schema.values())
+    if isinstance(schema, list):
+        for item in schema:
+            _foreign_key_models(item, labels)
+    return labels
+
+
+def _run_extractor(extractor, data):
+    out = []
+    extractor(data, out)
+    # Values may be found more than once, e.g. through several anyOf branches
+    return list(dict.fromkeys(out))
+
+
+_extractors = {}
+
+
+def foreign_key_extractors(schema):
+    """
+    Return a mapping of model labels to functions extracting primary keys
+
+    All fields using the ``foreign_key`` format and an ``options.model`` are
+    found in the schema, including fields in nested objects, arrays and
+    referenced definitions. Each function takes the data and returns the list
+    of primary keys of its model in a single pass over the data, so that they
+    can be used instead of ``foreign_key_paths`` or hand-written getters.
+    Models which aren't installed are skipped, so the app registry has to be
+    ready. Compiled extractors are cached by the fingerprint of the schema.
+    """
+    key = schema_fingerprint(schema)
+    if (extractors := _extractors.get(key)) is None:
+        extractors = {}
+        for label in sorted(_foreign_key_models(schema, set())):
+            try:
+                apps.get_model(label)
+            except (LookupError, ValueError):
+                continue
+            if extractor := _ExtractorCompiler(schema, label).compile(schema):
+                extractors[label] = partial(_run_extractor, extractor)
+        _extractors[key] = extractors
+    return extractors
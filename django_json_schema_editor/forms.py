@@ -1,30 +1,76 @@
+import hashlib
 import json
 import warnings
+from collections import defaultdict
 from copy import deepcopy
 
 import fastjsonschema
 from django import forms
 from django.apps import apps
 from django.conf import settings
+from django.core.cache import caches
 from django.core.exceptions import ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import signals
+from django.forms.boundfield import BoundField
+from django.urls import NoReverseMatch, reverse
+from django.utils.html import json_script
 from django.utils.text import Truncator
-from django.utils.translation import get_language
-from js_asset import JS, ImportMap, Media
+from django.utils.translation import get_language, gettext as _
+from js_asset import JS, ImportMap, Media, static_lazy
+
+from django_json_schema_editor.patch import apply_patch, changed_paths
+from django_json_schema_editor.validation import (
+    get_validator,
+    json_fingerprint,
+    validate_paths,
+)
 
 
+# The editor and its plugins are ES modules which are only loaded by
+# ``widget.js`` when the first editor is initialized, so pages where no editor
+# is opened never parse the json-editor bundle.
+importmap = ImportMap(
+    {
+        "imports": {
+            "django-json-schema-editor/jsoneditor": static_lazy(
+                "django_json_schema_editor/vendor/jsoneditor.js"
+            ),
+            "django-json-schema-editor/django-theme": static_lazy(
+                "django_json_schema_editor/django_theme.js"
+            ),
+            "django-json-schema-editor/foreign-key": static_lazy(
+                "django_json_schema_editor/foreign_key.js"
+            ),
+            "django-json-schema-editor/windowed-array": static_lazy(
+                "django_json_schema_editor/windowed_array.js"
+            ),
+        }
+    }
+)
+
 # Our prose editor plugin (``prose_editor.js``) imports
 # "django-prose-editor/configurable", which in turn imports
 # "django-prose-editor/editor". Reuse django-prose-editor's own import map (it
 # maps both) so we never duplicate or drift from its static paths.
 # ``js_asset.Media`` merges it with any other import maps on the page into a
 # single ``<script type="importmap">``. When django-prose-editor is not
-# installed the map stays empty and renders nothing, so the integration is
-# gracefully disabled.
+# installed the prose editor plugin isn't mapped and ``widget.js`` doesn't
+# load it, so the integration is gracefully disabled.
 try:
-    from django_prose_editor.widgets import importmap
+    from django_prose_editor.widgets import importmap as prose_editor_importmap
 except ImportError:
-    importmap = ImportMap({})
+    pass
+else:
+    importmap |= prose_editor_importmap | ImportMap(
+        {
+            "imports": {
+                "django-json-schema-editor/prose-editor": static_lazy(
+                    "django_json_schema_editor/prose_editor.js"
+                ),
+            }
+        }
+    )
 
 
 DEFAULT_CONFIG = getattr(
@@ -41,11 +87,74 @@ DEFAULT_CONFIG = getattr(
 )
 
 
+class JSONPatch:
+    """
+    A JSON Patch submitted by a widget in patch mode
+
+    The patch is applied to the document the form was rendered with, which is
+    only known to the bound field; see ``JSONEditorBoundField.data``.
+    """
+
+    def __init__(self, operations, base):
+        self.operations = operations
+        self.base = base
+        self.document = None
+
+    def apply(self):
+        if not hasattr(self, "_result"):
+            try:
+                self._result = self._apply()
+            except ValidationError as exc:
+                self._result = exc
+        if isinstance(self._result, ValidationError):
+            raise self._result
+        return self._result
+
+    def _apply(self):
+        if self.base != json_fingerprint(self.document):
+            raise ValidationError(
+                _(
+                    "The data has been changed by someone else in the meantime."
+                    " Reload the page and apply your changes again."
+                ),
+                code="stale",
+            )
+        try:
+            self.operations = json.loads(self.operations)
+            self.paths = changed_paths(self.operations)
+            return apply_patch(self.document, self.operations)
+        except (TypeError, ValueError) as exc:
+            raise ValidationError(
+                _("Invalid JSON Patch: {}").format(exc), code="invalid_patch"
+            ) from exc
+
+
+class JSONEditorBoundField(BoundField):
+    @property
+    def data(self):
+        data = super().data
+        if isinstance(data, JSONPatch):
+            data.document = self.initial
+        return data
+
+    def build_widget_attrs(self, attrs, widget=None):
+        attrs = super().build_widget_attrs(attrs, widget)
+        # Only offer submitting a patch against stored data; bound forms are
+        # re-rendered with the submitted document which isn't stored anywhere.
+        if self.field.patch and not self.form.is_bound and self.initial is not None:
+            attrs["data-patch-base"] = json_fingerprint(self.initial)
+        return attrs
+
+
 class JSONEditorField(forms.JSONField):
     def __init__(self, *args, **kwargs):
         self._config = kwargs.pop("config", {})
         self._schema = kwargs.pop("schema")
         self._foreign_key_descriptions = kwargs.pop("foreign_key_descriptions", [])
+        self.patch = kwargs.pop("patch", False)
+        # The schema and its validator; shared with the copies of the field
+        # created for each form instance
+        self._validator = [None, None]
         kwargs["widget"] = JSONEditorWidget
         super().__init__(*args, **kwargs)
         if self._config:
@@ -53,12 +162,47 @@ class JSONEditorField(forms.JSONField):
         if self._schema:
             self.widget.editor_config["schema"] = self._schema
         self.widget.foreign_key_descriptions = self._foreign_key_descriptions
+        self.widget.patch = self.patch
+
+    def get_bound_field(self, form, field_name):
+        return JSONEditorBoundField(form, self, field_name)
+
+    def get_validator(self):
+        """
+        Return the compiled validator of the schema
+
+        The validator cache is only consulted when the schema changes, which
+        avoids serializing and hashing the schema each time.
+        """
+        if self._validator[0] is not self._schema:
+            self._validator[:] = [self._schema, get_validator(self._schema)]
+        return self._validator[1]
+
+    def to_python(self, value):
+        if isinstance(value, JSONPatch):
+            return value.apply()
+        return super().to_python(value)
+
+    def bound_data(self, data, initial):
+        if isinstance(data, JSONPatch):
+            try:
+                return data.apply()
+            except ValidationError:
+                return initial
+        return super().bound_data(data, initial)
 
     def clean(self, value):
+        patch = value if isinstance(value, JSONPatch) else None
         value = super().clean(value)
         if schema := self._schema:
             try:
-                fastjsonschema.validate(schema, value, use_formats=False)
+                if patch is None:
+                    self.get_validator()(value)
+                else:
+                    # Only validate the parts of the document which changed
+                    validate_paths(
+                        schema, value, patch.paths, validator=self.get_validator()
+                    )
             except fastjsonschema.JsonSchemaValueException as ex:
                 raise ValidationError(ex.message) from ex
         else:
@@ -70,45 +214,292 @@ class JSONEditorField(forms.JSONField):
         return value
 
 
-def resolve_foreign_key_descriptions(model, pks):
-    pks = [pk for pk in pks if pk] if pks else ()
+LABELS_CACHE = getattr(settings, "JSONEDITORWIDGET_LABELS_CACHE", None)
+
+# Concrete models whose descriptions may be cached
+_label_models = set()
+
+
+def _label_cache_key(model, pk, language):
+    label = model._meta.concrete_model._meta.label_lower
+    return f"django-json-schema-editor:label:{label}:{language}:{pk}"
+
+
+def _label_cache_languages():
+    # Descriptions are cached per language since ``__str__`` may be translated
+    return {None, settings.LANGUAGE_CODE, *(code for code, _name in settings.LANGUAGES)}
+
+
+def _connect_label_invalidation(model):
+    signals.post_save.connect(invalidate_label, sender=model)
+    signals.post_delete.connect(invalidate_label, sender=model)
+
+
+def cache_labels_of(model):
+    """
+    Invalidate cached descriptions of the model when saving or deleting objects
+
+    Descriptions are only cached when the ``JSONEDITORWIDGET_LABELS_CACHE``
+    setting is set. Models are registered automatically when resolving their
+    descriptions and when starting up (for all models referenced by JSON fields
+    and plugins), but processes which never do either should register models
+    explicitly. The receivers are only connected for the model and its
+    subclasses and proxies.
+    """
+    model = model._meta.concrete_model
+    if model in _label_models:
+        return
+    _label_models.add(model)
+
+    subclasses = [model]
+    while subclasses:
+        cls = subclasses.pop()
+        _connect_label_invalidation(cls)
+        subclasses.extend(cls.__subclasses__())
+
+
+def _label_model_prepared(sender, **kwargs):
+    # Subclasses and proxies created after registering the model
+    if any(issubclass(sender, model) for model in _label_models):
+        _connect_label_invalidation(sender)
+
+
+signals.class_prepared.connect(_label_model_prepared)
+
+
+def invalidate_label(sender, instance, **kwargs):
+    if not LABELS_CACHE:
+        return
+    if keys := [
+        _label_cache_key(model, instance.pk, language)
+        for model in sender.__mro__
+        if model in _label_models
+        for language in _label_cache_languages()
+    ]:
+        caches[LABELS_CACHE].delete_many(keys)
+
+
+def _resolve_foreign_key_descriptions(model, pks):
     try:
-        return (
-            {
-                f"{model._meta.label_lower}:{obj.pk}": Truncator(obj).words(5)
-                for obj in model._default_manager.filter(pk__in=pks)
-            }
-            if pks
-            else {}
-        )
+        return {
+            f"{model._meta.label_lower}:{obj.pk}": Truncator(obj).words(5)
+            for obj in model._default_manager.filter(pk__in=pks)
+        }
     except (ValueError, TypeError):
         # This can happen when the list of primary keys contains values which
         # are not parseable as primary keys.
         return {}
 
 
+def resolve_foreign_key_descriptions(model, pks):
+    pks = [pk for pk in pks if pk] if pks else ()
+    if not pks:
+        return {}
+    if not LABELS_CACHE:
+        return _resolve_foreign_key_descriptions(model, pks)
+
+    cache = caches[LABELS_CACHE]
+    cache_labels_of(model)
+    label = model._meta.label_lower
+    language = get_language()
+    keys = {_label_cache_key(model, pk, language): pk for pk in pks}
+    descriptions = {
+        f"{label}:{keys[key]}": description
+        for key, description in cache.get_many(keys).items()
+    }
+    if missing := [
+        pk for key, pk in keys.items() if f"{label}:{pk}" not in descriptions
+    ]:
+        resolved = _resolve_foreign_key_descriptions(model, missing)
+        cache.set_many(
+            {
+                _label_cache_key(model, key.rpartition(":")[2], language): description
+                for key, description in resolved.items()
+            }
+        )
+        descriptions |= resolved
+    return descriptions
+
+
+def _get_model(model):
+    return apps.get_model(model) if isinstance(model, str) else model
+
+
+def _foreign_key_descriptions_url():
+    try:
+        return reverse("django_json_schema_editor:foreign_key_descriptions")
+    except NoReverseMatch:
+        return None
+
+
+class ForeignKeyDescriptionResolver:
+    """
+    Resolves the foreign key descriptions of many widgets at once
+
+    The primary keys referenced by the widgets of a form are registered using
+    ``add_form`` before rendering anything; the first widget being rendered
+    then resolves the descriptions of all registered primary keys with one
+    query per model and shares the result with all other widgets.
+    """
+
+    def __init__(self):
+        self.pending = defaultdict(set)
+        self.resolved = defaultdict(set)
+        self.descriptions = {}
+
+    def add(self, model, pks):
+        model = _get_model(model)
+        for pk in pks or ():
+            if not pk:
+                continue
+            # Skip primary keys which are not parseable, they would make the
+            # lookup fail for all other primary keys too.
+            try:
+                value = model._meta.pk.to_python(pk)
+            except (ValidationError, ValueError, TypeError):
+                continue
+            if value not in self.resolved[model]:
+                self.pending[model].add(value)
+
+    def add_form(self, form):
+        for bound_field in form:
+            widget = bound_field.field.widget
+            if not isinstance(widget, JSONEditorWidget) or not (
+                fkd := getattr(widget, "foreign_key_descriptions", None)
+            ):
+                continue
+            widget.foreign_key_description_resolver = self
+            try:
+                value = json.loads(bound_field.value())
+            except (TypeError, ValueError):
+                continue
+            if value:
+                for model, getter in fkd:
+                    self.add(model, getter(value))
+
+    def resolve(self, model, pks):
+        self.add(model, pks)
+        for pending_model, pending in self.pending.items():
+            self.descriptions |= resolve_foreign_key_descriptions(
+                pending_model, pending
+            )
+            self.resolved[pending_model] |= pending
+        self.pending.clear()
+
+        label = _get_model(model)._meta.label_lower
+        return {
+            key: self.descriptions[key]
+            for pk in pks or ()
+            if pk and (key := f"{label}:{pk}") in self.descriptions
+        }
+
+
+CONFIG_CACHE = getattr(settings, "JSONEDITORWIDGET_CONFIG_CACHE", None)
+LAZY_INIT = getattr(settings, "JSONEDITORWIDGET_LAZY_INIT", False)
+
+# Serialized editor configurations by their content hash. The number of
+# distinct configurations is bounded by the number of schemas and languages.
+_editor_configs = {}
+
+
+def _config_cache_key(key):
+    return f"django-json-schema-editor:config:{key}"
+
+
+def _config_hash(serialized):
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def register_editor_config(serialized):
+    """
+    Register the serialized editor configuration and return its content hash
+
+    The configuration is stored in the ``JSONEDITORWIDGET_CONFIG_CACHE`` cache
+    too, so that processes which haven't rendered the widget themselves are
+    able to serve it.
+    """
+    key = _config_hash(serialized)
+    if key not in _editor_configs:
+        _editor_configs[key] = serialized
+        if CONFIG_CACHE:
+            caches[CONFIG_CACHE].set(_config_cache_key(key), serialized, None)
+    return key
+
+
+def get_editor_config(key):
+    """
+    Return the serialized editor configuration with the content hash or None
+    """
+    serialized = _editor_configs.get(key)
+    if serialized is None and CONFIG_CACHE:
+        serialized = caches[CONFIG_CACHE].get(_config_cache_key(key))
+        if serialized is not None:
+            _editor_configs[key] = serialized
+    return serialized
+
+
+def _editor_config_url(key):
+    try:
+        return reverse("django_json_schema_editor:editor_config", kwargs={"key": key})
+    except NoReverseMatch:
+        return None
+
+
 class JSONEditorWidget(forms.Textarea):
     template_name = "django_json_schema_editor/widget.html"
     supported_translations = {"de"}
+    #: Accept JSON Patch submissions, set by ``JSONEditorField``
+    patch = False
 
-    def __init__(self, *args, editor_config=None, **kwargs):
+    def __init__(self, *args, editor_config=None, lazy=None, **kwargs):
         self.editor_config = deepcopy(DEFAULT_CONFIG)
         if editor_config:
             self.editor_config.update(editor_config)
+        self.lazy = LAZY_INIT if lazy is None else lazy
         super().__init__(*args, **kwargs)
 
+    def value_from_datadict(self, data, files, name):
+        value = super().value_from_datadict(data, files, name)
+        # Only fields which opted in may skip validating the whole document
+        if self.patch and (base := data.get(f"{name}-patch-base")) is not None:
+            return JSONPatch(value, base)
+        return value
+
     def get_context(self, *args, **kwargs):
         context = super().get_context(*args, **kwargs)
-        context["editor_config"] = json.dumps(self.editor_config, cls=DjangoJSONEncoder)
+        context["lazy"] = self.lazy
+        serialized = json.dumps(self.editor_config, cls=DjangoJSONEncoder)
+        emitted = getattr(self, "emitted_editor_configs", None)
+        if CONFIG_CACHE and (
+            url := _editor_config_url(register_editor_config(serialized))
+        ):
+            # Let browsers fetch and cache the configuration separately
+            context["editor_config_url"] = url
+        elif emitted is None:
+            context["editor_config"] = serialized
+        else:
+            # Emit each distinct configuration only once per page
+            config_id = f"djse-config-{_config_hash(serialized)[:16]}"
+            context["editor_config_id"] = config_id
+            if config_id not in emitted:
+                emitted.add(config_id)
+                context["editor_config_script"] = json_script(
+                    self.editor_config, config_id, encoder=DjangoJSONEncoder
+                )
+        context["foreign_key_descriptions_url"] = _foreign_key_descriptions_url()
 
         if (fkd := getattr(self, "foreign_key_descriptions", None)) and (
             value := json.loads(context["widget"]["value"])
         ):
             fk = {}
+            resolver = getattr(self, "foreign_key_description_resolver", None)
             for model, getter in fkd:
-                fk |= resolve_foreign_key_descriptions(
-                    apps.get_model(model), getter(value)
-                )
+                if resolver is None:
+                    fk |= resolve_foreign_key_descriptions(
+                        apps.get_model(model), getter(value)
+                    )
+                else:
+                    fk |= resolver.resolve(model, getter(value))
             context["foreign_key"] = json.dumps(fk)
         return context
 
@@ -120,15 +511,19 @@ class JSONEditorWidget(forms.Textarea):
                 "django_json_schema_editor/django_theme.css",
             ],
         }
+        imports = importmap
+        if (language := get_language()) in self.supported_translations:
+            imports |= ImportMap(
+                {
+                    "imports": {
+                        "django-json-schema-editor/language": static_lazy(
+                            f"django_json_schema_editor/language_{language}.js"
+                        ),
+                    }
+                }
+            )
         js = [
-            importmap,
-            "django_json_schema_editor/vendor/jsoneditor.js",
-            "django_json_schema_editor/django_theme.js",
-            "django_json_schema_editor/foreign_key.js",
-            "django_json_schema_editor/widget.js",
-            JS("django_json_schema_editor/prose_editor.js", {"type": "module"}),
+            imports,
+            JS("django_json_schema_editor/widget.js", {"type": "module"}),
         ]
-        language = get_language()
-        if language in self.supported_translations:
-            js.append(f"django_json_schema_editor/language_{language}.js")
         return Media(css=css, js=js)
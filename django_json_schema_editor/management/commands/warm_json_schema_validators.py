@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from django_json_schema_editor.validation import VALIDATOR_CACHE_DIR, warm_up
+
+
+class Command(BaseCommand):
+    help = "Compile the validators of all registered JSON schemas."
+
+    def handle(self, **options):
+        count = warm_up()
+        if VALIDATOR_CACHE_DIR:
+            self.stdout.write(
+                f"Compiled {count} validators into {VALIDATOR_CACHE_DIR}."
+            )
+        else:
+            self.stdout.write(
+                f"Compiled {count} validators. Set JSONEDITORWIDGET_VALIDATOR_CACHE_DIR"
+                " to persist the generated code."
+            )
@@ -0,0 +1,148 @@
+"""
+Minimal implementation of JSON Patch (RFC 6902) and JSON Pointer (RFC 6901)
+"""
+
+import copy
+
+
+class JSONPatchError(ValueError):
+    pass
+
+
+def parse_pointer(pointer):
+    """
+    Split a JSON pointer into its unescaped reference tokens
+    """
+    if pointer == "":
+        return []
+    if not isinstance(pointer, str) or not pointer.startswith("/"):
+        raise JSONPatchError(f"Invalid JSON pointer {pointer!r}.")
+    return [
+        token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")
+    ]
+
+
+def _index(container, token, *, insert=False):
+    if insert and token == "-":
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith("0")):
+        raise JSONPatchError(f"Invalid array index {token!r}.")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not insert):
+        raise JSONPatchError(f"Array index {token!r} out of range.")
+    return index
+
+
+def resolve_pointer(document, tokens):
+    """
+    Return the value referenced by the reference tokens
+    """
+    for token in tokens:
+        if isinstance(document, list):
+            document = document[_index(document, token)]
+        elif isinstance(document, dict) and token in document:
+            document = document[token]
+        else:
+            raise JSONPatchError(f"Path {tokens!r} does not exist.")
+    return document
+
+
+def _add(document, tokens, value):
+    if not tokens:
+        return value
+    parent = resolve_pointer(document, tokens[:-1])
+    if isinstance(parent, list):
+        parent.insert(_index(parent, tokens[-1], insert=True), value)
+    elif isinstance(parent, dict):
+        parent[tokens[-1]] = value
+    else:
+        raise JSONPatchError(f"Cannot add a value at {tokens!r}.")
+    return document
+
+
+def _remove(document, tokens):
+    if not tokens:
+        raise JSONPatchError("Cannot remove the root of the document.")
+    parent = resolve_pointer(document, tokens[:-1])
+    if isinstance(parent, list):
+        return parent.pop(_index(parent, tokens[-1]))
+    if isinstance(parent, dict) and tokens[-1] in parent:
+        return parent.pop(tokens[-1])
+    raise JSONPatchError(f"Path {tokens!r} does not exist.")
+
+
+def _value(operation):
+    if "value" not in operation:
+        raise JSONPatchError(f"Operation {operation!r} is missing its value.")
+    return copy.deepcopy(operation["value"])
+
+
+def apply_patch(document, operations):
+    """
+    Apply the JSON Patch operations to a copy of the document and return it
+
+    Raises ``JSONPatchError`` if the patch is invalid or cannot be applied.
+    """
+    if not isinstance(operations, list):
+        raise JSONPatchError("A JSON Patch has to be a list of operations.")
+
+    document = copy.deepcopy(document)
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise JSONPatchError(f"Invalid operation {operation!r}.")
+        path = parse_pointer(operation.get("path"))
+        op = operation.get("op")
+        if op == "add":
+            document = _add(document, path, _value(operation))
+        elif op == "remove":
+            _remove(document, path)
+        elif op == "replace":
+            value = _value(operation)
+            if path:
+                _remove(document, path)
+            document = _add(document, path, value)
+        elif op == "move":
+            source = parse_pointer(operation.get("from"))
+            if path[: len(source)] == source and len(path) > len(source):
+                raise JSONPatchError("Cannot move a value into itself.")
+            if source:
+                document = _add(document, path, _remove(document, source))
+        elif op == "copy":
+            source = parse_pointer(operation.get("from"))
+            value = copy.deepcopy(resolve_pointer(document, source))
+            document = _add(document, path, value)
+        elif op == "test":
+            if resolve_pointer(document, path) != operation.get("value"):
+                raise JSONPatchError(f"Test of {operation['path']!r} failed.")
+        else:
+            raise JSONPatchError(f"Unknown operation {op!r}.")
+    return document
+
+
+def changed_paths(operations):
+    """
+    Return the reference tokens of the smallest set of locations containing
+    all changes made by the operations
+
+    Adding and removing values changes the containing object or array, so the
+    parent location is returned for those operations.
+    """
+    paths = []
+    for operation in operations:
+        path = parse_pointer(operation.get("path"))
+        op = operation.get("op")
+        if op == "replace":
+            paths.append(path)
+        elif op in {"add", "copy", "remove"}:
+            paths.append(path[:-1])
+        elif op == "move":
+            paths.append(path[:-1])
+            paths.append(parse_pointer(operation.get("from"))[:-1])
+
+    # Drop locations contained in other locations
+    paths.sort(key=len)
+    result = []
+    for path in paths:
+        if not any(path[: len(other)] == other for other in result):
+            result.append(path)
+    return result
@@ -1,30 +1,175 @@
+from collections import defaultdict
+from copy import copy
 from functools import partial
+from itertools import islice
 
 import jmespath
 from content_editor.admin import ContentEditorInline
 from django.apps import apps
-from django.core.exceptions import ImproperlyConfigured
+from django.core.exceptions import ImproperlyConfigured, ValidationError
 from django.db import models
-from django.db.models.query import ModelIterable
-from django.utils.text import capfirst
+from django.db.models.query import ModelIterable, prefetch_related_objects
+from django.forms.models import BaseInlineFormSet
+from django.utils.text import Truncator, capfirst
 from django.utils.translation import gettext_lazy as _
 
-from django_json_schema_editor.fields import JSONField, paths_to_pks
-from django_json_schema_editor.forms import JSONEditorField
+from django_json_schema_editor.fields import (
+    JSONField,
+    batch_reference_validation,
+    compile_path,
+    foreign_key_extractors,
+    paths_to_pks,
+    snapshot_json_fields,
+)
+from django_json_schema_editor.forms import (
+    ForeignKeyDescriptionResolver,
+    JSONEditorField,
+    JSONEditorWidget,
+)
+
+
+# Prefix of the annotations loading fields for the types not deferring them
+_LISTING_PREFIX = "_listing_"
+
+
+def _prefetch_related_hints(plugins):
+    lookups = defaultdict(list)
+    for plugin in plugins:
+        for lookup in plugin._prefetch_related:
+            lookups[lookup].append(plugin)
+    # One prefetch per lookup across all types declaring it
+    for lookup, instances in lookups.items():
+        prefetch_related_objects(instances, lookup)
+
+
+def _json_reference_candidates(plugin):
+    """
+    Yield the path, the model and the primary keys of each reference
+
+    Types without ``foreign_key_paths`` use the foreign keys found in the
+    schema, their references are keyed by the model label instead.
+    """
+    if foreign_key_paths := plugin._proxy_types_foreign_key_paths.get(plugin.type):
+        for label, paths in foreign_key_paths.items():
+            to = apps.get_model(label)
+            for path in paths:
+                yield (
+                    path.expression,
+                    to,
+                    paths_to_pks(plugin.data, to=to, paths=[path]),
+                )
+    else:
+        for label, extractor in plugin._get_foreign_key_extractors().items():
+            yield label, apps.get_model(label), extractor(plugin.data)
+
+
+def _prefetch_json_references(plugins):
+    candidates = []
+    pks = defaultdict(set)
+    for plugin in plugins:
+        plugin.json_references = {}
+        # Loading the data of each plugin would defeat the purpose
+        if "data" in plugin.get_deferred_fields():
+            continue
+        for key, to, values in _json_reference_candidates(plugin):
+            converted = []
+            for value in values:
+                try:
+                    converted.append(to._meta.pk.to_python(value))
+                except ValidationError:
+                    continue
+            pks[to].update(converted)
+            candidates.append((plugin, key, to, converted))
+
+    # One query per referenced model
+    objects = {to: to._default_manager.in_bulk(pks[to]) for to in pks}
+    for plugin, key, to, converted in candidates:
+        plugin.json_references[key] = [
+            objects[to][pk] for pk in converted if pk in objects[to]
+        ]
 
 
 class _JSONPluginModelIterable(ModelIterable):
+    json_references = False
+
     def __iter__(self):
         mapping = self.queryset.model._proxy_types_map
-        for obj in super().__iter__():
-            obj.__class__ = mapping[obj.type]
-            yield obj
+        listing_fields = [
+            self.queryset.model._meta.get_field(name.removeprefix(_LISTING_PREFIX))
+            for name in self.queryset.query.annotations
+            if name.startswith(_LISTING_PREFIX)
+        ]
+
+        def downcast(plugins):
+            for obj in plugins:
+                obj.__class__ = mapping[obj.type]
+                for field in listing_fields:
+                    value = obj.__dict__.pop(f"{_LISTING_PREFIX}{field.name}")
+                    if field.name not in obj._listing_defer:
+                        obj.__dict__[field.attname] = value
+                if listing_fields:
+                    snapshot_json_fields(obj)
+                yield obj
+
+        plugins = downcast(super().__iter__())
+        # Iterators prefetch per chunk, everything else at once
+        while chunk := list(
+            islice(plugins, self.chunk_size if self.chunked_fetch else None)
+        ):
+            _prefetch_related_hints(chunk)
+            if self.json_references:
+                _prefetch_json_references(chunk)
+            yield from chunk
+
+
+class _JSONReferencesModelIterable(_JSONPluginModelIterable):
+    json_references = True
 
 
 class _JSONPluginQuerySet(models.QuerySet):
-    def downcast(self):
+    def downcast(self, *, listing=False):
+        """
+        Return instances of the proxy types and prefetch the lookups declared
+        by them
+
+        Fields declared by the proxy types using ``defer`` are not loaded for
+        their plugins if ``listing`` is ``True``.
+        """
         obj = self._chain()
-        obj._iterable_class = _JSONPluginModelIterable
+        if not issubclass(obj._iterable_class, _JSONPluginModelIterable):
+            obj._iterable_class = _JSONPluginModelIterable
+        if listing:
+            proxies = getattr(self.model, "_proxy_types_map", {}).values()
+            names = set().union(*(proxy._listing_defer for proxy in proxies))
+            for name in names:
+                types = [
+                    proxy.TYPE for proxy in proxies if name in proxy._listing_defer
+                ]
+                # The other types still need the field, load it using an
+                # annotation which is empty for the deferring types
+                if len(types) < len(proxies):
+                    obj = obj.annotate(
+                        **{
+                            f"{_LISTING_PREFIX}{name}": models.Case(
+                                models.When(~models.Q(type__in=types), then=name),
+                                output_field=self.model._meta.get_field(name),
+                            )
+                        }
+                    )
+            obj = obj.defer(*names)
+        return obj
+
+    def prefetch_json_references(self):
+        """
+        Resolve the objects referenced in the data of all plugins
+
+        The referenced objects of each model are loaded using one query and
+        attached to the plugins as ``json_references``, a dictionary of lists
+        of objects keyed by the ``foreign_key_paths`` or by the model label
+        for references found in the schema. Implies ``downcast()``.
+        """
+        obj = self.downcast()
+        obj._iterable_class = _JSONReferencesModelIterable
         return obj
 
 
@@ -34,15 +179,43 @@ class JSONPluginBase(models.Model):
 
     objects = _JSONPluginQuerySet.as_manager()
 
+    _prefetch_related = ()
+    _listing_defer = frozenset()
+
     class Meta:
         abstract = True
 
     def __str__(self):
+        if label := self._data_label():
+            return label
+        return f'{capfirst(self._type_label())} on {self.parent._meta.verbose_name} "{self.parent}"'
+
+    def save(self, *args, **kwargs):
+        self.type = self.TYPE
+        super().save(*args, **kwargs)
+
+    save.alters_data = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        snapshot_json_fields(instance)
+        return instance
+
+    @classmethod
+    def get_queryset(cls):
+        return super().get_queryset().downcast()
+
+    def _data_label(self):
         path_value = None
         schema = getattr(self, "SCHEMA", {})
         if schema and (path := schema.get("__str__")):
             try:
-                path_value = jmespath.search(path, self.data)
+                # Proxies compile their expression when they are created
+                if expression := getattr(self, "_str_expression", None):
+                    path_value = expression.search(self.data)
+                else:
+                    path_value = jmespath.search(path, self.data)
             except Exception:
                 pass
 
@@ -50,21 +223,14 @@ class JSONPluginBase(models.Model):
             return str(path_value)
         if title := schema.get("title"):
             return str(title)
+        return None
 
-        type = self.type
-        if cls := self._proxy_types_map.get(self.type):
-            type = cls._meta.verbose_name
-        return f'{capfirst(type)} on {self.parent._meta.verbose_name} "{self.parent}"'
-
-    def save(self, *args, **kwargs):
-        self.type = self.TYPE
-        super().save(*args, **kwargs)
-
-    save.alters_data = True
-
-    @classmethod
-    def get_queryset(cls):
-        return super().get_queryset().downcast()
+    def _type_label(self):
+        # New instances only get their type when saving
+        type = getattr(self, "TYPE", self.type)
+        if cls := self._proxy_types_map.get(type):
+            return cls._meta.verbose_name
+        return type
 
     @classmethod
     def proxy(
@@ -76,6 +242,9 @@ class JSONPluginBase(models.Model):
         verbose_name=None,
         meta=None,
         mixins=None,
+        prefetch_related=None,
+        defer=None,
+        schema_foreign_keys=False,
     ):
         meta = {} if meta is None else meta
         meta["proxy"] = True
@@ -93,6 +262,18 @@ class JSONPluginBase(models.Model):
                 f"The proxy type {type_name!r} has already been registered on {cls!r}."
             )
 
+        # Compile the expressions once; invalid expressions fail early
+        str_expression = compile_path(path) if (path := schema.get("__str__")) else None
+        foreign_key_paths = {
+            model: [compile_path(path) for path in paths]
+            for model, paths in (foreign_key_paths or {}).items()
+        }
+
+        # Fail early for unknown fields
+        defer = frozenset(defer or ())
+        for name in defer:
+            cls._meta.get_field(name)
+
         # Convert mixins to tuple if provided as list
         mixins_tuple = tuple(mixins) if mixins else ()
 
@@ -104,40 +285,242 @@ class JSONPluginBase(models.Model):
                 "Meta": meta_class,
                 "TYPE": type_name,
                 "SCHEMA": schema,
+                "_str_expression": str_expression,
+                "_schema_foreign_keys": schema_foreign_keys,
+                "_prefetch_related": tuple(prefetch_related or ()),
+                "_listing_defer": defer,
             },
         )
         cls._proxy_types_map[type_name] = new_type
-        cls._proxy_types_foreign_key_paths[type_name] = foreign_key_paths or {}
+        cls._proxy_types_foreign_key_paths[type_name] = foreign_key_paths
         return new_type
 
     @classmethod
-    def register_foreign_key_reference(cls, model, *, name):
+    def register_foreign_key_reference(cls, model, *, name, deferred=False):
         def _getter(plugin):
+            # New instances only get their type when saving
+            type = getattr(plugin, "TYPE", plugin.type)
+            label = model._meta.label_lower
+            # Explicit paths take precedence over the paths found in the schema
+            if foreign_key_paths := cls._proxy_types_foreign_key_paths.get(type):
+                if paths := foreign_key_paths.get(label):
+                    return paths_to_pks(to=model, paths=paths, data=plugin.data)
+            elif (proxy := cls._proxy_types_map.get(type)) and (
+                extractor := proxy._get_foreign_key_extractors().get(label)
+            ):
+                return extractor(plugin.data)
+            return []
+
+        cls.register_data_reference(model, name=name, getter=_getter, deferred=deferred)
+
+    @classmethod
+    def _get_foreign_key_extractors(cls):
+        """
+        Return the foreign key extractors of proxies created with
+        ``schema_foreign_keys=True``
+
+        The extractors are compiled when they are first needed since the models
+        referenced by the schema may not have been loaded yet when creating the
+        proxy.
+        """
+        if not cls.__dict__.get("_schema_foreign_keys"):
+            return {}
+        if "_foreign_key_extractors" not in cls.__dict__:
+            cls._foreign_key_extractors = foreign_key_extractors(cls.SCHEMA)
+        return cls._foreign_key_extractors
+
+
+class LabeledJSONPluginBase(JSONPluginBase):
+    """
+    JSON plugin base storing its label in an indexed database column
+
+    The label is determined when saving the plugin, so that ``__str__``, admin
+    ordering and search do not have to load the JSON data or the parent.
+    """
+
+    label = models.CharField(
+        _("label"), max_length=200, blank=True, editable=False, db_index=True
+    )
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return self.label or super().__str__()
+
+    def save(self, *args, **kwargs):
+        # Only update the label if the data has been loaded
+        if "data" in self.__dict__:
+            self.label = self.get_label()
+            if (update_fields := kwargs.get("update_fields")) is not None and (
+                "data" in update_fields
+            ):
+                kwargs["update_fields"] = {*update_fields, "label"}
+        super().save(*args, **kwargs)
+
+    save.alters_data = True
+
+    def get_label(self):
+        """
+        Return the label determined by the ``__str__`` expression of the schema
+
+        Falls back to the schema title and the type of the plugin.
+        """
+        label = self._data_label() or capfirst(self._type_label())
+        return Truncator(label).chars(self._meta.get_field("label").max_length)
+
+    @classmethod
+    def update_labels(cls, queryset=None, *, batch_size=1000):
+        """
+        Update the labels of existing plugins, e.g. after adding the column
+        """
+        queryset = cls._default_manager.all() if queryset is None else queryset
+        plugins = []
+        for plugin in queryset.downcast().iterator(chunk_size=batch_size):
+            plugin.label = plugin.get_label()
+            plugins.append(plugin)
+            if len(plugins) >= batch_size:
+                cls._default_manager.bulk_update(plugins, ["label"])
+                plugins = []
+        cls._default_manager.bulk_update(plugins, ["label"])
+
+
+class _JSONPluginLoader:
+    """
+    Loads the plugins of a parent for all JSON plugin inlines at once
+
+    The plugins of all proxy types are fetched with one query and partitioned
+    by their type.
+    """
+
+    def __init__(self):
+        self._plugins = {}
+
+    def plugins(self, queryset, fk, instance, type):
+        model = queryset.model._meta.concrete_model
+        ordering = tuple(queryset.query.order_by or queryset.model._meta.ordering)
+        key = (model, fk.name, instance.pk, ordering)
+        if key not in self._plugins:
+            self._plugins[key] = plugins = defaultdict(list)
+            for plugin in (
+                model._default_manager.filter(
+                    **{fk.name: instance}, type__in=list(model._proxy_types_map)
+                )
+                .order_by(*ordering)
+                .downcast()
+            ):
+                plugins[plugin.type].append(plugin)
+        return self._plugins[key].get(type, [])
+
+
+class JSONPluginInlineFormSet(BaseInlineFormSet):
+    """
+    Validates the references and resolves the foreign key descriptions of all
+    forms with one query per target model, and emits each distinct editor
+    configuration only once
+    """
+
+    #: Shared between formsets to resolve descriptions and deduplicate editor
+    #: configurations of several formsets at once, see
+    #: ``JSONPluginInline.get_formset``
+    foreign_key_description_resolver = None
+    emitted_editor_configs = None
+    #: Loads the plugins of all formsets with one query if set
+    plugin_loader = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.foreign_key_description_resolver is None:
+            self.foreign_key_description_resolver = ForeignKeyDescriptionResolver()
+        if self.emitted_editor_configs is None:
+            self.emitted_editor_configs = set()
+
+    def get_queryset(self):
+        if not hasattr(self, "_queryset"):
+            queryset = super().get_queryset()
+            # The admin empties the queryset for users without the view or
+            # change permission, the loader must not bypass that.
             if (
-                foreign_key_paths := cls._proxy_types_foreign_key_paths.get(plugin.type)
-            ) and (paths := foreign_key_paths.get(model._meta.label_lower)):
-                return paths_to_pks(
-                    to=model,
-                    paths=paths,
-                    data=plugin.data,
+                self.plugin_loader is not None
+                and self.instance.pk is not None
+                and not queryset.query.is_empty()
+            ):
+                queryset._result_cache = self.plugin_loader.plugins(
+                    queryset, self.fk, self.instance, self.model.TYPE
                 )
-            return []
+        return self._queryset
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        self._prepare_form(form)
+        return form
+
+    @property
+    def empty_form(self):
+        form = super().empty_form
+        self._prepare_form(form)
+        return form
 
-        cls.register_data_reference(model, name=name, getter=_getter)
+    def _prepare_form(self, form):
+        for field in form.fields.values():
+            if isinstance(field.widget, JSONEditorWidget):
+                field.widget.emitted_editor_configs = self.emitted_editor_configs
+        self.foreign_key_description_resolver.add_form(form)
+
+    def full_clean(self):
+        with batch_reference_validation() as validation:
+            if self.is_bound:
+                for form in self.forms:
+                    validation.add(self._submitted_instance(form))
+            super().full_clean()
+
+    def _submitted_instance(self, form):
+        instance = copy(form.instance)
+        for field in instance._meta.concrete_fields:
+            if isinstance(field, JSONField) and field.name in form.fields:
+                try:
+                    value = form.fields[field.name].to_python(form[field.name].data)
+                except ValidationError:
+                    continue
+                setattr(instance, field.attname, value)
+        return instance
 
 
 class JSONPluginInline(ContentEditorInline):
+    formset = JSONPluginInlineFormSet
+    #: Submit changes to existing plugins as JSON Patch, see ``JSONEditorField``
+    json_patch = False
+
     def get_queryset(self, request):
         return super().get_queryset(request).filter(type=self.model.TYPE)
 
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        # Load the plugins, resolve the descriptions and deduplicate the editor
+        # configurations of all JSON plugin inlines of the response at once
+        if not hasattr(request, "_json_plugin_inline_state"):
+            request._json_plugin_inline_state = (
+                ForeignKeyDescriptionResolver(),
+                set(),
+                _JSONPluginLoader(),
+            )
+        (
+            formset.foreign_key_description_resolver,
+            formset.emitted_editor_configs,
+            loader,
+        ) = request._json_plugin_inline_state
+        # The shared query cannot know about customized querysets
+        if type(self).get_queryset is JSONPluginInline.get_queryset:
+            formset.plugin_loader = loader
+        return formset
+
     def formfield_for_dbfield(self, db_field, request, **kwargs):
         if db_field.name == "data":
             foreign_key_descriptions = getattr(self, "foreign_key_descriptions", [])
-            if not foreign_key_descriptions and (
-                foreign_key_paths := self.model._proxy_types_foreign_key_paths.get(
-                    self.model.TYPE
-                )
-            ):
+            foreign_key_paths = self.model._proxy_types_foreign_key_paths.get(
+                self.model.TYPE
+            )
+            if not foreign_key_descriptions and foreign_key_paths:
                 for model, paths in foreign_key_paths.items():
                     to = apps.get_model(model)
                     foreign_key_descriptions.append(
@@ -146,9 +529,15 @@ class JSONPluginInline(ContentEditorInline):
                             partial(paths_to_pks, to=to, paths=paths),
                         )
                     )
+            elif not foreign_key_descriptions:
+                # Use the foreign keys found in the schema
+                foreign_key_descriptions = list(
+                    self.model._get_foreign_key_extractors().items()
+                )
             kwargs["form_class"] = partial(
                 JSONEditorField,
                 schema=self.model.SCHEMA,
                 foreign_key_descriptions=foreign_key_descriptions,
+                patch=self.json_patch,
             )
         return super().formfield_for_dbfield(db_field, request, **kwargs)
@@ -1,7 +1,8 @@
 const { JSONEditor } = window
 
-/* Patch functions with ones emitting a 'change' event after closing the popup */
-document.addEventListener("DOMContentLoaded", () => {
+/* Patch functions with ones emitting a 'change' event after closing the popup.
+ * This module is loaded lazily, the document may already have been loaded. */
+const patchDismissRelatedLookupPopup = () => {
   const __original_dismissRelatedLookupPopup = window.dismissRelatedLookupPopup
   window.dismissRelatedLookupPopup = (win, chosenId) => {
     // Django allows more than one popup per raw ID field, account for that.
@@ -10,9 +11,60 @@ document.addEventListener("DOMContentLoaded", () => {
 
     input.dispatchEvent(new InputEvent("input", { bubbles: true }))
   }
-})
+}
+if (document.readyState === "loading") {
+  document.addEventListener("DOMContentLoaded", patchDismissRelatedLookupPopup)
+} else {
+  patchDismissRelatedLookupPopup()
+}
 /* End patching */
 
+/* Fetch missing descriptions from the server. Lookups of all editors on the
+ * page are coalesced into one request per URL. */
+const pendingDescriptions = new Map()
+let pendingDescriptionsTimeout
+
+const fetchDescriptions = () => {
+  const batches = [...pendingDescriptions]
+  pendingDescriptions.clear()
+
+  for (const [url, callbacks] of batches) {
+    const params = new URLSearchParams()
+    for (const key of callbacks.keys()) {
+      params.append("key", key)
+    }
+    fetch(`${url}?${params}`, {
+      credentials: "same-origin",
+      headers: { Accept: "application/json" },
+    })
+      .then((response) => (response.ok ? response.json() : {}))
+      .catch(() => ({}))
+      .then((descriptions) => {
+        for (const [key, keyCallbacks] of callbacks) {
+          // Remember missing descriptions too to avoid fetching them again
+          window.__djse_foreignKeys[key] = descriptions[key] ?? ""
+          for (const callback of keyCallbacks) {
+            callback(window.__djse_foreignKeys[key])
+          }
+        }
+      })
+  }
+}
+
+const describeForeignKey = (url, key, callback) => {
+  if (!pendingDescriptions.has(url)) {
+    pendingDescriptions.set(url, new Map())
+  }
+  const callbacks = pendingDescriptions.get(url)
+  if (!callbacks.has(key)) {
+    callbacks.set(key, [])
+  }
+  callbacks.get(key).push(callback)
+
+  clearTimeout(pendingDescriptionsTimeout)
+  pendingDescriptionsTimeout = setTimeout(fetchDescriptions, 50)
+}
+
 JSONEditor.defaults.editors.foreign_key = class extends (
   JSONEditor.defaults.editors.string
 ) {
@@ -33,7 +85,7 @@ JSONEditor.defaults.editors.foreign_key = class extends (
       e.stopPropagation()
 
       this.value = this.input.value
-      this.relatedName.textContent = ""
+      this.updateRelatedName()
       this.onChange(true)
     })
 
@@ -48,8 +100,7 @@ JSONEditor.defaults.editors.foreign_key = class extends (
     )
 
     this.relatedName = document.createElement("strong")
-    this.relatedName.textContent =
-      window.__djse_foreignKeys?.[`${this.options.model}:${this.value}`]
+    this.updateRelatedName()
 
     const wrapper = document.createElement("div")
     wrapper.append(this.input, relatedLookupLink, this.relatedName)
@@ -60,8 +111,23 @@ JSONEditor.defaults.editors.foreign_key = class extends (
   setValue(...args) {
     super.setValue(...args)
     if (this.relatedName) {
-      this.relatedName.textContent =
-        window.__djse_foreignKeys?.[`${this.options.model}:${this.value}`]
+      this.updateRelatedName()
+    }
+  }
+
+  updateRelatedName() {
+    const key = `${this.options.model}:${this.value}`
+    this.relatedName.textContent = window.__djse_foreignKeys?.[key] ?? ""
+
+    const root = this.jsoneditor.element.closest(".django_json_schema_editor")
+    const url = root?.dataset.foreignKeyUrl
+    if (url && this.value && !(key in window.__djse_foreignKeys)) {
+      describeForeignKey(url, key, (description) => {
+        // The value may have changed in the meantime
+        if (`${this.options.model}:${this.value}` === key) {
+          this.relatedName.textContent = description
+        }
+      })
     }
   }
 }
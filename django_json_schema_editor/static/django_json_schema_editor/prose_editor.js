@@ -15,37 +15,53 @@ const defaults = {
   Superscript: true,
 }
 
-function createJSONProseEditor(textarea, options, setClobber) {
-  setClobber(null)
-
+function createJSONProseEditor(textarea, options) {
   let extensions = defaults
   if (Object.hasOwn(options, "extensions")) {
     extensions = options.extensions
   }
 
-  createEditor(textarea, {
+  return createEditor(textarea, {
     ...options,
     extensions: { ...core, ...extensions },
-  }).then((editor) => {
-    setClobber(() => {
-      editor.destroy()
-    })
   })
 }
 
+/* Prose editors are only created when they come near the viewport or when
+ * their textarea receives focus. Until then the plain textarea is shown. */
+const proseEditorObserver =
+  "IntersectionObserver" in window
+    ? new IntersectionObserver(
+        (entries) => {
+          for (const entry of entries) {
+            if (entry.isIntersecting) {
+              proseEditorObserver.unobserve(entry.target)
+              entry.target.__djse_createProseEditor?.()
+            }
+          }
+        },
+        { rootMargin: "200px" },
+      )
+    : null
+
 JSONEditor.defaults.editors.prose = class extends (
   JSONEditor.defaults.editors.string
 ) {
   setValue(value, initial, fromTemplate) {
     const res = super.setValue(value, initial, fromTemplate)
 
-    if (res?.changed) {
-      this.clobber?.()
-
-      createJSONProseEditor(this.input, this.options, (clobber) => {
-        this.clobber = clobber
+    // Update the existing prose editor in place instead of recreating it,
+    // e.g. when reordering array items or when propagating the start value.
+    if (
+      res?.changed &&
+      this.proseEditor &&
+      this.proseEditor.getHTML() !== this.input.value
+    ) {
+      this.proseEditor.commands.setContent(this.input.value, {
+        emitUpdate: false,
       })
     }
+    return res
   }
 
   build() {
@@ -55,20 +71,53 @@ JSONEditor.defaults.editors.prose = class extends (
   }
 
   afterInputReady() {
-    this.clobber?.()
-    createJSONProseEditor(this.input, this.options, (clobber) => {
-      this.clobber = clobber
+    const input = this.input
+    input.__djse_createProseEditor = () => this.createProseEditor()
+    input.addEventListener("focus", input.__djse_createProseEditor, {
+      once: true,
     })
+    if (proseEditorObserver) {
+      proseEditorObserver.observe(input)
+    } else {
+      this.createProseEditor()
+    }
 
-    this.input.addEventListener("input", (e) => {
+    input.addEventListener("input", (e) => {
       e.preventDefault()
       e.stopPropagation()
 
-      this.value = this.input.value
+      this.value = input.value
       this.onChange(true)
     })
   }
 
+  createProseEditor() {
+    if (this.proseEditorPromise || this.proseEditorDestroyed) {
+      return
+    }
+    proseEditorObserver?.unobserve(this.input)
+    this.proseEditorPromise = createJSONProseEditor(
+      this.input,
+      this.options,
+    ).then((editor) => {
+      if (this.proseEditorDestroyed) {
+        editor?.destroy()
+      } else {
+        this.proseEditor = editor
+      }
+    })
+  }
+
+  destroy() {
+    this.proseEditorDestroyed = true
+    if (this.input) {
+      proseEditorObserver?.unobserve(this.input)
+    }
+    this.proseEditor?.destroy()
+    this.proseEditor = null
+    super.destroy()
+  }
+
   getNumColumns() {
     return 6
   }
@@ -1,16 +1,144 @@
 window.__djse_foreignKeys = {}
 
-document.addEventListener("DOMContentLoaded", () => {
+/* The json-editor bundle and our plugins are only loaded when the first editor
+ * is initialized. Optional modules (translations, the prose editor) are only
+ * loaded when the import map contains them. */
+let jsonEditorLoaded
+
+const importOptional = (specifier) => {
+  try {
+    import.meta.resolve(specifier)
+  } catch {
+    return null
+  }
+  return import(specifier)
+}
+
+const loadJSONEditor = () => {
+  jsonEditorLoaded ??= (async () => {
+    await import("django-json-schema-editor/jsoneditor")
+    await Promise.all([
+      import("django-json-schema-editor/django-theme"),
+      import("django-json-schema-editor/foreign-key"),
+      import("django-json-schema-editor/windowed-array"),
+      importOptional("django-json-schema-editor/language"),
+      importOptional("django-json-schema-editor/prose-editor"),
+    ])
+    // Allow registering additional plugins before editors are created
+    document.dispatchEvent(new CustomEvent("django-json-schema-editor:loaded"))
+  })()
+  return jsonEditorLoaded
+}
+
+const onReady = (f) => {
+  if (document.readyState === "loading") {
+    document.addEventListener("DOMContentLoaded", f)
+  } else {
+    f()
+  }
+}
+
+/* Editor configurations may be emitted once per page and referenced by ID.
+ * Remember them early, the element containing them may be removed later. */
+const editorConfigs = new Map()
+
+const collectEditorConfigs = () => {
+  const scripts = document.querySelectorAll('script[id^="djse-config-"]')
+  for (const script of scripts) {
+    if (!editorConfigs.has(script.id)) {
+      editorConfigs.set(script.id, script.textContent)
+    }
+  }
+}
+
+/* Configurations served under content-hashed URLs are fetched once per page,
+ * browsers cache them across page loads. */
+const editorConfigRequests = new Map()
+
+const fetchEditorConfig = (url) => {
+  if (!editorConfigRequests.has(url)) {
+    editorConfigRequests.set(
+      url,
+      fetch(url, { credentials: "same-origin" }).then((response) => {
+        if (!response.ok) {
+          throw new Error(`Unable to load the editor config ${url}`)
+        }
+        return response.text()
+      }),
+    )
+  }
+  return editorConfigRequests.get(url)
+}
+
+const getEditorConfig = async (el) => {
+  if (el.dataset.editorConfigUrl) {
+    // Parse again, editors modify their configuration
+    return JSON.parse(await fetchEditorConfig(el.dataset.editorConfigUrl))
+  }
+  const id = el.dataset.editorConfigId
+  if (!id) {
+    return JSON.parse(el.dataset.editorConfig)
+  }
+  if (!editorConfigs.has(id)) {
+    collectEditorConfigs()
+  }
+  return JSON.parse(editorConfigs.get(id))
+}
+
+onReady(() => {
+  collectEditorConfigs()
+
   const editors = document.querySelectorAll(".django_json_schema_editor")
   for (const el of editors) {
     const textarea = el.querySelector("textarea")
     if (textarea && !textarea.id.includes("__prefix__")) {
-      initEditor(el)
+      // Empty editors have to fill the textarea with their defaults
+      if ("lazy" in el.dataset && hasStoredData(textarea)) {
+        initEditorLazily(el)
+      } else {
+        initEditor(el)
+      }
     }
   }
 })
 
-document.addEventListener("DOMContentLoaded", () => {
+const hasStoredData = (textarea) =>
+  Boolean(textarea.value && JSON.parse(textarea.value))
+
+/* Lazily initialized editors show a placeholder until they are scrolled into
+ * view or focused. The textarea stays authoritative, so the data of editors
+ * which are never initialized is submitted unchanged. */
+const lazyEditorObserver =
+  "IntersectionObserver" in window
+    ? new IntersectionObserver(
+        (entries) => {
+          for (const entry of entries) {
+            if (entry.isIntersecting) {
+              initEditor(entry.target)
+            }
+          }
+        },
+        { rootMargin: "200px" },
+      )
+    : null
+
+const initEditorLazily = (el) => {
+  if (!lazyEditorObserver) {
+    initEditor(el)
+    return
+  }
+
+  const placeholder = document.createElement("div")
+  placeholder.className = "django_json_schema_editor__placeholder"
+  placeholder.tabIndex = 0
+  el.append(placeholder)
+
+  el.addEventListener("focusin", () => initEditor(el), { once: true })
+  placeholder.addEventListener("click", () => initEditor(el), { once: true })
+  lazyEditorObserver.observe(el)
+}
+
+onReady(() => {
   django.jQuery(document).on("formset:added", (event) => {
     const editors = event.target.querySelectorAll(".django_json_schema_editor")
     for (const el of editors) {
@@ -21,25 +149,142 @@ document.addEventListener("DOMContentLoaded", () => {
 
 let editorIndex = 0
 
-const initEditor = (el) => {
+/* Serialization callbacks of editors whose data hasn't been written back into
+ * the textarea yet */
+const dirtyEditors = new Set()
+
+const flushEditors = () => {
+  for (const serialize of dirtyEditors) {
+    serialize()
+  }
+}
+
+// Capture the event so that the textareas are up to date before any other
+// submit handler runs
+document.addEventListener("submit", flushEditors, true)
+
+/* Editors in patch mode submit a JSON Patch (RFC 6902) against the document
+ * they have been rendered with instead of the whole document. */
+const escapePointer = (key) => key.replaceAll("~", "~0").replaceAll("/", "~1")
+
+const isObject = (value) =>
+  value !== null && typeof value === "object" && !Array.isArray(value)
+
+const diffJSON = (before, after, path = "", operations = []) => {
+  if (isObject(before) && isObject(after)) {
+    for (const key of Object.keys(before)) {
+      if (!Object.hasOwn(after, key)) {
+        operations.push({ op: "remove", path: `${path}/${escapePointer(key)}` })
+      }
+    }
+    for (const [key, value] of Object.entries(after)) {
+      const keyPath = `${path}/${escapePointer(key)}`
+      if (Object.hasOwn(before, key)) {
+        diffJSON(before[key], value, keyPath, operations)
+      } else {
+        operations.push({ op: "add", path: keyPath, value })
+      }
+    }
+  } else if (Array.isArray(before) && Array.isArray(after)) {
+    const common = Math.min(before.length, after.length)
+    for (let i = 0; i < common; ++i) {
+      diffJSON(before[i], after[i], `${path}/${i}`, operations)
+    }
+    for (let i = before.length - 1; i >= common; --i) {
+      operations.push({ op: "remove", path: `${path}/${i}` })
+    }
+    for (let i = common; i < after.length; ++i) {
+      operations.push({ op: "add", path: `${path}/${i}`, value: after[i] })
+    }
+  } else if (JSON.stringify(before) !== JSON.stringify(after)) {
+    operations.push({ op: "replace", path, value: after })
+  }
+  return operations
+}
+
+// The formdata event is fired after the submit event, when the editors have
+// already been flushed.
+document.addEventListener(
+  "formdata",
+  (e) => {
+    const textareas = e.target.querySelectorAll("textarea[data-patch-base]")
+    for (const textarea of textareas) {
+      if (!textarea.name || !e.formData.has(textarea.name)) {
+        continue
+      }
+      const operations =
+        textarea.value === textarea.defaultValue
+          ? []
+          : diffJSON(
+              JSON.parse(textarea.defaultValue),
+              JSON.parse(textarea.value),
+            )
+      e.formData.set(textarea.name, JSON.stringify(operations))
+      e.formData.set(`${textarea.name}-patch-base`, textarea.dataset.patchBase)
+    }
+  },
+  true,
+)
+
+const requestIdle = (f) => {
+  if ("requestIdleCallback" in window) {
+    window.requestIdleCallback(f, { timeout: 1000 })
+  } else {
+    setTimeout(f, 0)
+  }
+}
+
+const initializedEditors = new WeakSet()
+
+const initEditor = async (el) => {
+  if (initializedEditors.has(el)) {
+    return
+  }
+  initializedEditors.add(el)
+  lazyEditorObserver?.unobserve(el)
+
   if (el.dataset.foreignKey) {
     Object.assign(window.__djse_foreignKeys, JSON.parse(el.dataset.foreignKey))
   }
 
   const input = el.querySelector("textarea")
-  const config = JSON.parse(el.dataset.editorConfig)
+  const [config] = await Promise.all([getEditorConfig(el), loadJSONEditor()])
 
-  let value
-  if (input.value && (value = JSON.parse(input.value))) {
+  const value = input.value ? JSON.parse(input.value) : null
+  const storedData = Boolean(value)
+  if (storedData) {
     config.startval = value
   }
 
   // Set an unique name so that form widgets get somewhat more unique names
   config.form_name_root = `djse${++editorIndex}`
 
-  const editor = new JSONEditor(el, config)
+  el.querySelector(".django_json_schema_editor__placeholder")?.remove()
+  const editor = new window.JSONEditor(el, config)
+
+  // Serializing walks the whole editor, only do it when the editor is idle or
+  // when the form is submitted, and only if the editor has been changed.
+  const serialize = () => {
+    if (dirtyEditors.delete(serialize)) {
+      input.value = JSON.stringify(editor.getValue())
+    }
+  }
+  const scheduleSerialize = debounce(() => requestIdle(serialize), 300)
+
+  // The editor triggers a change event directly after the ready event. When
+  // the editor loaded stored data that data hasn't been changed yet, but empty
+  // editors have to serialize the defaults they have been filled with.
+  let initialChange = false
+  editor.on("ready", () => {
+    initialChange = storedData
+  })
   editor.on("change", () => {
-    input.value = JSON.stringify(editor.getValue())
+    if (initialChange) {
+      initialChange = false
+      return
+    }
+    dirtyEditors.add(serialize)
+    scheduleSerialize()
   })
 
   // The JSON is only updated on change events. This can cause edits to be lost
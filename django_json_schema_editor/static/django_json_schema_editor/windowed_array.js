@@ -0,0 +1,226 @@
+/* global JSONEditor */
+
+/* Array editor which only builds editors for the items near the viewport.
+ * The values of all other items are kept as plain JSON until they are
+ * scrolled into view, and editors of items scrolled far away are destroyed
+ * again. Use ``"format": "windowed"`` on array schemas to enable it. */
+
+const itemDefaults = {
+  object: {},
+  array: [],
+  string: "",
+  number: 0,
+  integer: 0,
+  boolean: false,
+}
+
+JSONEditor.defaults.editors.windowed_array = class extends (
+  JSONEditor.AbstractEditor
+) {
+  getDefault() {
+    return this.schema.default ?? []
+  }
+
+  build() {
+    this.value = []
+    this.rowEditors = new Map()
+
+    this.title = this.theme.getHeader(this.getTitle())
+    this.container.appendChild(this.title)
+    if (this.schema.description) {
+      this.description = this.theme.getDescription(
+        this.translateProperty(this.schema.description),
+      )
+      this.container.appendChild(this.description)
+    }
+
+    this.rowHolder = document.createElement("div")
+    this.container.appendChild(this.rowHolder)
+
+    this.controls = this.theme.getButtonHolder()
+    this.container.appendChild(this.controls)
+    this.addButton = this.theme.getButton(
+      this.getItemTitle(),
+      "add",
+      this.translate("button_add_row_title", [this.getItemTitle()]),
+    )
+    this.addButton.addEventListener("click", (e) => {
+      e.preventDefault()
+      e.stopPropagation()
+      this.addItem()
+    })
+    this.controls.appendChild(this.addButton)
+
+    this.observer = new IntersectionObserver(
+      (entries) => {
+        for (const entry of entries) {
+          if (entry.isIntersecting) {
+            this.materialize(entry.target)
+          } else {
+            this.dematerialize(entry.target)
+          }
+        }
+      },
+      { rootMargin: `${this.options.buffer ?? 1000}px 0px` },
+    )
+  }
+
+  getItemTitle() {
+    this.itemTitle ??=
+      this.translateProperty(this.getItemSchema().title) ||
+      this.translate("default_array_item_title")
+    return this.itemTitle
+  }
+
+  getItemSchema() {
+    return this.jsoneditor.expandRefs({ ...this.schema.items })
+  }
+
+  getItemDefault() {
+    const schema = this.getItemSchema()
+    return structuredClone(schema.default ?? itemDefaults[schema.type] ?? null)
+  }
+
+  renderRows() {
+    this.observer.disconnect()
+    for (const editor of this.rowEditors.values()) {
+      editor.destroy()
+    }
+    this.rowEditors.clear()
+    this.rowHolder.replaceChildren()
+    for (let index = 0; index < this.value.length; ++index) {
+      this.appendRow(index)
+    }
+  }
+
+  appendRow(index) {
+    const row = document.createElement("div")
+    row.dataset.index = index
+    row.style.minHeight = `${this.options.row_height ?? 80}px`
+    this.rowHolder.appendChild(row)
+    this.observer.observe(row)
+  }
+
+  materialize(row) {
+    if (this.rowEditors.has(row)) {
+      return
+    }
+
+    const index = Number(row.dataset.index)
+    const schema = this.getItemSchema()
+    schema.title = `${this.getItemTitle()} ${index + 1}`
+    const holder = this.theme.getIndentedPanel()
+    row.replaceChildren(holder)
+
+    const editor = this.jsoneditor.createEditor(
+      this.jsoneditor.getEditorClass(schema),
+      {
+        jsoneditor: this.jsoneditor,
+        schema,
+        container: holder,
+        path: `${this.path}.${index}`,
+        parent: this,
+        required: true,
+      },
+    )
+    editor.preBuild()
+    editor.build()
+    editor.postBuild()
+    editor.setValue(this.value[index], true)
+    editor.windowedIndex = index
+    // Editors may fill in defaults, take them over without triggering changes
+    this.value[index] = editor.getValue()
+    this.rowEditors.set(row, editor)
+
+    const controls = this.theme.getButtonHolder()
+    const deleteButton = this.theme.getButton(
+      "",
+      "delete",
+      this.translate("button_delete_row_title", [this.getItemTitle()]),
+    )
+    deleteButton.addEventListener("click", (e) => {
+      e.preventDefault()
+      e.stopPropagation()
+      this.removeItem(index)
+    })
+    controls.appendChild(deleteButton)
+    holder.appendChild(controls)
+
+    if (this.validationErrors) {
+      editor.showValidationErrors(this.validationErrors)
+    }
+  }
+
+  dematerialize(row) {
+    const editor = this.rowEditors.get(row)
+    if (!editor) {
+      return
+    }
+    // Keep the height so that the scroll position doesn't jump
+    row.style.minHeight = `${row.offsetHeight}px`
+    this.value[editor.windowedIndex] = editor.getValue()
+    this.rowEditors.delete(row)
+    editor.destroy()
+    row.replaceChildren()
+  }
+
+  addItem() {
+    this.value.push(this.getItemDefault())
+    this.appendRow(this.value.length - 1)
+    this.onChange(true)
+  }
+
+  removeItem(index) {
+    this.value.splice(index, 1)
+    this.renderRows()
+    this.onChange(true)
+  }
+
+  onChildEditorChange(editor, eventData) {
+    this.value[editor.windowedIndex] = editor.getValue()
+    this.is_dirty = true
+    super.onChildEditorChange(editor, eventData)
+  }
+
+  setValue(value) {
+    this.value = Array.isArray(value) ? [...value] : []
+    this.renderRows()
+    this.onChange()
+  }
+
+  getValue() {
+    // Callers must not be able to modify the state of the editor
+    return structuredClone(this.value)
+  }
+
+  showValidationErrors(errors) {
+    this.validationErrors = errors
+    for (const editor of this.rowEditors.values()) {
+      editor.showValidationErrors(errors)
+    }
+  }
+
+  destroy() {
+    this.observer?.disconnect()
+    for (const editor of this.rowEditors?.values() ?? []) {
+      editor.destroy()
+    }
+    this.rowEditors?.clear()
+    for (const el of [this.title, this.description, this.rowHolder]) {
+      el?.remove()
+    }
+    this.controls?.remove()
+    super.destroy()
+  }
+}
+
+JSONEditor.defaults.resolvers.unshift((schema) => {
+  if (
+    schema.type === "array" &&
+    schema.format === "windowed" &&
+    schema.items &&
+    !Array.isArray(schema.items)
+  ) {
+    return "windowed_array"
+  }
+})
@@ -0,0 +1,19 @@
+from django.urls import path, re_path
+
+from django_json_schema_editor import views
+
+
+app_name = "django_json_schema_editor"
+urlpatterns = [
+    path(
+        "foreign-key-descriptions/",
+        views.foreign_key_descriptions,
+        name="foreign_key_descriptions",
+    ),
+    # Configurations are served by their SHA-256 hash, see forms._config_hash
+    re_path(
+        r"^editor-configs/(?P<key>[0-9a-f]{64})\.json$",
+        views.editor_config,
+        name="editor_config",
+    ),
+]
@@ -0,0 +1,280 @@
+import hashlib
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+
+import fastjsonschema
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from django_json_schema_editor.patch import resolve_pointer
+
+
+VALIDATOR_CACHE_SIZE = getattr(settings, "JSONEDITORWIDGET_VALIDATOR_CACHE_SIZE", 256)
+VALIDATOR_CACHE_DIR = getattr(settings, "JSONEDITORWIDGET_VALIDATOR_CACHE_DIR", None)
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+def canonical_json(schema):
+    """
+    Serialize the schema into a canonical JSON string
+
+    Keys are sorted and lazy translation strings are evaluated so that equal
+    schemas always produce the same string.
+    """
+    return json.dumps(
+        schema, cls=DjangoJSONEncoder, sort_keys=True, separators=(",", ":")
+    )
+
+
+def json_fingerprint(value):
+    """
+    Return a stable fingerprint of a JSON value, suitable as a cache key
+    """
+    return hashlib.sha256(canonical_json(value).encode()).hexdigest()
+
+
+def schema_fingerprint(schema):
+    """
+    Return a stable fingerprint of the schema, suitable as a cache key
+    """
+    return json_fingerprint(schema)
+
+
+class _ValidatorCache:
+    """
+    Process-wide LRU cache of compiled ``fastjsonschema`` validators
+
+    Validators are keyed by the schema fingerprint so that equal schemas share
+    one compiled validator even if they are distinct ``dict`` instances.
+
+    When a ``cache_dir`` is given the generated validator code is additionally
+    stored in importable modules on disk, so that other processes only have to
+    import the module instead of generating the code again.
+    """
+
+    def __init__(self, maxsize, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._validators = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, schema):
+        serialized = canonical_json(schema)
+        key = hashlib.sha256(serialized.encode()).hexdigest()
+        with self._lock:
+            if (validator := self._validators.get(key)) is not None:
+                self._validators.move_to_end(key)
+                self.hits += 1
+                return validator
+            self.misses += 1
+
+        # Compile outside the lock; compiling the same schema twice when racing
+        # is harmless.
+        validator = self.compile(key, json.loads(serialized))
+
+        with self._lock:
+            self._validators[key] = validator
+            self._validators.move_to_end(key)
+            while len(self._validators) > self.maxsize:
+                self._validators.popitem(last=False)
+        return validator
+
+    def compile(self, key, schema):
+        if not self.cache_dir:
+            return fastjsonschema.compile(schema, use_formats=False)
+
+        # The generated code depends on the fastjsonschema version
+        name = "djse_{}".format(
+            hashlib.sha256(f"{key}:{fastjsonschema.VERSION}".encode()).hexdigest()
+        )
+        path = os.path.join(self.cache_dir, f"{name}.py")
+        if not os.path.exists(path):
+            code = fastjsonschema.compile_to_code(schema, use_formats=False)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write atomically, other processes may be warming up concurrently
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(code)
+            os.replace(tmp, path)
+
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module.validate
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.maxsize, len(self._validators)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._validators.clear()
+            self.hits = self.misses = 0
+
+
+_cache = _ValidatorCache(VALIDATOR_CACHE_SIZE, VALIDATOR_CACHE_DIR)
+
+
+def get_validator(schema):
+    """
+    Return a compiled validator for the schema, compiling it only once
+    """
+    return _cache.get(schema)
+
+
+def validate(schema, value):
+    """
+    Validate the value against the schema using the cached validator
+
+    Raises ``fastjsonschema.JsonSchemaValueException`` when the value is
+    invalid.
+    """
+    return get_validator(schema)(value)
+
+
+# Keywords making the validity of a value depend on which subschema matches
+# or on other parts of the document. Subschemas are not resolved below them.
+_UNRESOLVABLE_KEYWORDS = {
+    "allOf",
+    "anyOf",
+    "oneOf",
+    "not",
+    "if",
+    "patternProperties",
+    "dependencies",
+    "dependentSchemas",
+    "unevaluatedItems",
+    "unevaluatedProperties",
+}
+
+# Keywords constraining the children of a value as a whole. Changing a child
+# of a value using them requires validating the value itself.
+_AGGREGATE_KEYWORDS = {
+    "const",
+    "contains",
+    "dependentRequired",
+    "enum",
+    "maxContains",
+    "maxItems",
+    "maxProperties",
+    "minContains",
+    "minItems",
+    "minProperties",
+    "propertyNames",
+    "required",
+    "uniqueItems",
+}
+
+
+def _expand_ref(root, schema):
+    while isinstance(schema, dict) and "$ref" in schema:
+        ref = schema["$ref"]
+        if len(schema) > 1 or not ref.startswith("#/"):
+            return None
+        schema = root
+        for token in ref[2:].split("/"):
+            if not isinstance(schema, dict):
+                return None
+            schema = schema.get(token.replace("~1", "/").replace("~0", "~"))
+    return schema if isinstance(schema, dict) else None
+
+
+def subschema(schema, path):
+    """
+    Return the schema of the value at the path (a list of reference tokens)
+
+    Returns ``None`` if the subschema cannot be determined without looking at
+    the data, e.g. when the path crosses ``oneOf`` or ``patternProperties``,
+    or if validating the value on its own isn't sufficient because a schema
+    along the path constrains its children as a whole, e.g. using
+    ``uniqueItems`` or ``enum``. The returned schema contains the dialect and
+    the definitions of the root schema, so that local references keep working.
+    """
+    current = _expand_ref(schema, schema)
+    for token in path:
+        if current is None or (
+            (_UNRESOLVABLE_KEYWORDS | _AGGREGATE_KEYWORDS) & current.keys()
+        ):
+            return None
+        items = current.get("items")
+        if token in current.get("properties", {}):
+            current = current["properties"][token]
+        elif token.isdigit() and isinstance(items, dict):
+            current = items
+        elif token.isdigit() and isinstance(items, list) and int(token) < len(items):
+            current = items[int(token)]
+        else:
+            return None
+        current = _expand_ref(schema, current)
+
+    if current is None or _UNRESOLVABLE_KEYWORDS & current.keys():
+        return None
+    return current | {
+        key: schema[key] for key in ("$schema", "definitions", "$defs") if key in schema
+    }
+
+
+def validate_paths(schema, value, paths, *, validator=None):
+    """
+    Validate only the parts of the value at the given paths
+
+    Paths are lists of reference tokens as returned by
+    ``patch.changed_paths``. Falls back to validating the whole value (using
+    the ``validator`` if given) if the schema of any of the parts cannot be
+    determined.
+    """
+    parts = []
+    for path in paths:
+        if not path or (part_schema := subschema(schema, path)) is None:
+            return (validator or get_validator(schema))(value)
+        parts.append((part_schema, resolve_pointer(value, path)))
+    for part_schema, part in parts:
+        validate(part_schema, part)
+    return value
+
+
+def validator_cache_info():
+    """
+    Return hits, misses, the maximum and the current size of the cache
+    """
+    return _cache.info()
+
+
+def validator_cache_clear():
+    _cache.clear()
+
+
+def registered_schemas():
+    """
+    Yield the schemas of all JSON plugin types and schema-carrying JSON fields
+    """
+    for model in apps.get_models():
+        if (schema := model.__dict__.get("SCHEMA")) and isinstance(schema, dict):
+            yield schema
+        for field in model._meta.local_fields:
+            # Duck-typed to avoid a circular import of fields.JSONField
+            if schema := getattr(field, "_schema", None):
+                yield schema
+
+
+def warm_up():
+    """
+    Compile the validators of all registered schemas
+
+    Returns the number of distinct schemas.
+    """
+    fingerprints = set()
+    for schema in registered_schemas():
+        get_validator(schema)
+        fingerprints.add(schema_fingerprint(schema))
+    return len(fingerprints)
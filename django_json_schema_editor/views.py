@@ -0,0 +1,68 @@
+from collections import defaultdict
+
+from django.apps import apps
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth import get_permission_codename
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
+
+from django_json_schema_editor.forms import (
+    ForeignKeyDescriptionResolver,
+    get_editor_config,
+)
+
+
+def _has_view_permission(user, model):
+    opts = model._meta
+    return any(
+        user.has_perm(f"{opts.app_label}.{get_permission_codename(action, opts)}")
+        for action in ("view", "change")
+    )
+
+
+@require_GET
+@staff_member_required
+def foreign_key_descriptions(request):
+    """
+    Return the descriptions of many ``app_label.model_name:pk`` keys at once
+
+    Keys are passed using repeated ``key`` query parameters. Keys referencing
+    unknown models, models the user may not view and objects which do not
+    exist are left out of the response.
+    """
+    keys = defaultdict(list)
+    for key in request.GET.getlist("key"):
+        label, _sep, pk = key.partition(":")
+        try:
+            model = apps.get_model(label)
+        except (LookupError, ValueError):
+            continue
+        keys[model].append(pk)
+
+    resolver = ForeignKeyDescriptionResolver()
+    models = [model for model in keys if _has_view_permission(request.user, model)]
+    for model in models:
+        resolver.add(model, keys[model])
+
+    descriptions = {}
+    for model in models:
+        descriptions |= resolver.resolve(model, keys[model])
+    return JsonResponse(descriptions)
+
+
+@require_GET
+@staff_member_required
+@condition(etag_func=lambda request, key: key)
+def editor_config(request, key):
+    """
+    Return the editor configuration with the given content hash
+
+    The URL changes whenever the configuration changes, so responses may be
+    cached forever.
+    """
+    if (serialized := get_editor_config(key)) is None:
+        raise Http404
+    response = HttpResponse(serialized, content_type="application/json")
+    patch_cache_control(response, private=True, max_age=31536000, immutable=True)
+    return response
@@ -11,6 +11,11 @@ class FileAdmin(admin.ModelAdmin):
     pass
 
 
+@admin.register(models.Playlist)
+class PlaylistAdmin(admin.ModelAdmin):
+    pass
+
+
 @admin.register(models.Thing)
 class ThingAdmin(admin.ModelAdmin):
     def formfield_for_dbfield(self, db_field, request, **kwargs):
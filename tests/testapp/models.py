@@ -2,7 +2,7 @@ from content_editor.models import Region, create_plugin_base
 from django.db import models
 
 from django_json_schema_editor.fields import JSONField
-from django_json_schema_editor.plugins import JSONPluginBase
+from django_json_schema_editor.plugins import JSONPluginBase, LabeledJSONPluginBase
 
 
 def itemgetter(key):
@@ -44,6 +44,29 @@ class Thing(models.Model):
         return ""
 
 
+class Playlist(models.Model):
+    data = JSONField(
+        schema={
+            "type": "object",
+            "properties": {
+                "tracks": {
+                    "type": "array",
+                    "format": "windowed",
+                    "items": {
+                        "type": "object",
+                        "title": "Track",
+                        "properties": {"title": {"type": "string"}},
+                        "default": {"title": "New track"},
+                    },
+                },
+            },
+        },
+    )
+
+    def __str__(self):
+        return ""
+
+
 def get_file_ids(plugin):
     file = plugin.data.get("file")
     if file:
@@ -58,6 +81,31 @@ Thing.register_data_reference(
 )
 
 
+class Collection(models.Model):
+    data = JSONField(
+        schema={
+            "type": "object",
+            "properties": {
+                "files": {
+                    "type": "array",
+                    "items": {"type": "string", "format": "foreign_key"},
+                },
+            },
+        },
+    )
+
+    def __str__(self):
+        return ""
+
+
+Collection.register_data_reference(
+    File,
+    name="files",
+    getter=lambda collection: collection.data.get("files"),
+    deferred=True,
+)
+
+
 class Article(models.Model):
     regions = [Region(key="main", title="main")]
 
@@ -97,3 +145,13 @@ Download = JSONPlugin.proxy(
         "testapp.file": ["file"],
     },
 )
+
+
+class LabeledJSONPlugin(LabeledJSONPluginBase, ArticlePlugin):
+    pass
+
+
+Term = LabeledJSONPlugin.proxy(
+    "term",
+    schema={"__str__": "term", "properties": {"term": {"type": "string"}}},
+)
@@ -1,15 +1,40 @@
+import contextlib
 import json
 import os
+import re
 
+import fastjsonschema
 import pytest
 from django import forms
 from django.contrib.auth.models import User
+from django.core.cache import caches
 from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import signals
 from django.db.models.deletion import ProtectedError
+from django.test.utils import CaptureQueriesContext
+from django.urls import Resolver404, resolve
+from django.utils import translation
 from playwright.sync_api import expect
 
-from django_json_schema_editor.forms import resolve_foreign_key_descriptions
-from testapp.models import Article, Download, File, Thing
+from django_json_schema_editor import forms as forms_module
+from django_json_schema_editor.fields import sync_references
+from django_json_schema_editor.forms import (
+    resolve_foreign_key_descriptions,
+)
+from django_json_schema_editor.patch import JSONPatchError, apply_patch, changed_paths
+from django_json_schema_editor.validation import (
+    _ValidatorCache,
+    get_validator,
+    json_fingerprint,
+    registered_schemas,
+    schema_fingerprint,
+    subschema,
+    validator_cache_clear,
+    validator_cache_info,
+    warm_up,
+)
+from testapp.models import Article, Collection, Download, File, Playlist, Thing
 
 
 # Set Django async unsafe to allow database operations in tests
@@ -102,8 +127,10 @@ def test_json_editor_prose(page, live_server):
 
 @pytest.mark.django_db
 @pytest.mark.e2e
-def test_json_editor_edit_save(page, live_server):
+@pytest.mark.parametrize("lazy_init", [False, True])
+def test_json_editor_edit_save(page, live_server, monkeypatch, lazy_init):
     """Test editing and saving content in the JSON editor."""
+    monkeypatch.setattr(forms_module, "LAZY_INIT", lazy_init)
     login_admin(page, live_server)
 
     thing = Thing.objects.create(
@@ -159,6 +186,61 @@ def test_json_editor_edit_save(page, live_server):
     expect(raw_id_field_label).to_contain_text("file-42.png")
 
 
+@pytest.mark.django_db
+@pytest.mark.e2e
+def test_windowed_array(page, live_server):
+    """Test that windowed arrays only build the editors of visible items."""
+    login_admin(page, live_server)
+
+    playlist = Playlist.objects.create(
+        data={"tracks": [{"title": f"Track {i}"} for i in range(100)]}
+    )
+
+    page.goto(f"{live_server.url}/admin/testapp/playlist/{playlist.pk}/change/")
+    editor = page.locator(".django_json_schema_editor")
+    expect(editor.locator('input[name="root[tracks][0][title]"]')).to_have_value(
+        "Track 0"
+    )
+
+    # Items far below the viewport are not materialized
+    titles = editor.locator('input[name^="root[tracks]"]')
+    assert titles.count() < 100
+    expect(editor.locator('input[name="root[tracks][99][title]"]')).to_have_count(0)
+
+    # Scrolling materializes the items
+    editor.locator('[data-index="99"]').scroll_into_view_if_needed()
+    last = editor.locator('input[name="root[tracks][99][title]"]')
+    expect(last).to_have_value("Track 99")
+    last.fill("Edited")
+    last.press("Tab")
+
+    editor.locator('button[title="Add Track"]').click()
+    expect(editor.locator('[data-index="100"]')).to_have_count(1)
+
+    editor.locator('[data-index="0"]').scroll_into_view_if_needed()
+    editor.locator('[data-index="0"] button[title="Delete Track"]').click()
+    expect(editor.locator('input[name="root[tracks][0][title]"]')).to_have_value(
+        "Track 1"
+    )
+
+    # The value is written back into the textarea
+    expected = [{"title": f"Track {i}"} for i in range(1, 99)] + [
+        {"title": "Edited"},
+        {"title": "New track"},
+    ]
+    page.wait_for_function(
+        """expected => JSON.stringify(
+          JSON.parse(document.querySelector("textarea#id_data").value).tracks
+        ) === expected""",
+        arg=json.dumps(expected, separators=(",", ":")),
+    )
+
+    page.click('input[name="_save"]')
+    page.wait_for_url(f"{live_server.url}/admin/testapp/playlist/")
+    playlist.refresh_from_db()
+    assert playlist.data == {"tracks": expected}
+
+
 @pytest.mark.django_db
 @pytest.mark.e2e
 def test_json_editor_display(page, live_server):
@@ -584,3 +666,453 @@ def test_validation():
     form = ThingForm({"data": json.dumps({"stuff": "123"})})
     assert not form.is_valid()
     assert "data.stuff must match pattern" in str(form.errors)
+
+
+@pytest.mark.django_db
+def test_validator_cache():
+    validator_cache_clear()
+
+    class ThingForm(forms.ModelForm):
+        class Meta:
+            model = Thing
+            fields = ["data"]
+
+    for _i in range(3):
+        form = ThingForm({"data": json.dumps({"stuff": "ABC"})})
+        assert form.is_valid()
+
+    # The form field only looks up its validator once
+    info = validator_cache_info()
+    assert info.misses == 1
+    assert info.hits == 0
+    assert info.currsize == 1
+
+    # Equal schemas share a validator, different schemas don't
+    assert get_validator({"type": "string"}) is get_validator({"type": "string"})
+    assert get_validator({"type": "string"}) is not get_validator({"type": "integer"})
+    assert schema_fingerprint({"a": 1, "b": 2}) == schema_fingerprint({"b": 2, "a": 1})
+
+
+def test_validator_disk_cache(tmp_path):
+    schema = {"type": "object", "properties": {"stuff": {"pattern": "^[A-Z]*$"}}}
+
+    validator = _ValidatorCache(8, str(tmp_path)).get(schema)
+    assert validator({"stuff": "ABC"}) == {"stuff": "ABC"}
+    with pytest.raises(fastjsonschema.JsonSchemaValueException):
+        validator({"stuff": "abc"})
+
+    files = list(tmp_path.glob("djse_*.py"))
+    assert len(files) == 1
+
+    # Another process reuses the generated module
+    mtime = files[0].stat().st_mtime_ns
+    validator = _ValidatorCache(8, str(tmp_path)).get(schema)
+    assert validator({"stuff": "ABC"}) == {"stuff": "ABC"}
+    assert files[0].stat().st_mtime_ns == mtime
+
+
+def test_validator_warm_up():
+    validator_cache_clear()
+    schemas = list(registered_schemas())
+    assert Thing._meta.get_field("data")._schema in schemas
+    assert Download.SCHEMA in schemas
+
+    distinct = {schema_fingerprint(schema) for schema in schemas}
+    assert warm_up() == len(distinct)
+    assert validator_cache_info().misses == len(distinct)
+
+    hits = validator_cache_info().hits
+    get_validator(Download.SCHEMA)
+    assert validator_cache_info().hits == hits + 1
+
+
+@pytest.mark.django_db
+def test_deferred_data_references(django_capture_on_commit_callbacks):
+    """Deferred references are synchronized once when committing."""
+    files = [File.objects.create(name=f"file-{i}.png") for i in range(1, 5)]
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        collection = Collection.objects.create(data={"files": [files[0].pk]})
+        collection.data["files"].append(files[1].pk)
+        collection.save()
+        other = Collection.objects.create(data={"files": [files[2].pk]})
+
+        # Nothing has been synchronized yet
+        assert not Collection.files.through.objects.exists()
+
+    assert len(callbacks) == 1
+    assert {file.pk for file in collection.files.all()} == {files[0].pk, files[1].pk}
+    assert {file.pk for file in other.files.all()} == {files[2].pk}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        collection.data["files"] = [files[3].pk]
+        collection.save()
+        other.delete()
+
+    assert {file.pk for file in collection.files.all()} == {files[3].pk}
+    files[0].delete()
+
+    # Changes of rolled back savepoints are not synchronized
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        collection.data["files"] = [files[2].pk]
+        collection.save()
+        with contextlib.suppress(RuntimeError), transaction.atomic():
+            collection.data["files"] = [files[1].pk]
+            collection.save()
+            raise RuntimeError
+
+    assert len(callbacks) == 1
+    assert {file.pk for file in collection.files.all()} == {files[2].pk}
+
+
+@pytest.mark.django_db
+def test_sync_references():
+    """References of bulk created and updated instances are synchronized."""
+    files = [File.objects.create(name=f"file-{i}.png") for i in range(3)]
+    things = Thing.objects.bulk_create(
+        [Thing(data={"file": file.pk}) for file in files]
+    )
+    assert not Thing.files.through.objects.exists()
+
+    with CaptureQueriesContext(connection) as ctx:
+        assert sync_references(Thing.objects.order_by("pk"), batch_size=2) == 3
+    # Two batches checking the files, reading and inserting the references
+    assert len(ctx) == 1 + 2 * 3
+    assert [[file.pk for file in thing.files.all()] for thing in things] == [
+        [file.pk] for file in files
+    ]
+
+    Thing.objects.filter(pk=things[0].pk).update(data={"file": files[2].pk})
+    Thing.objects.filter(pk=things[1].pk).update(data={})
+    sync_references(Thing.objects.all())
+    assert [[file.pk for file in thing.files.all()] for thing in things] == [
+        [files[2].pk],
+        [],
+        [files[2].pk],
+    ]
+
+    assert sync_references(File.objects.all()) == 0
+
+
+@pytest.mark.django_db
+def test_foreign_key_descriptions_cache(monkeypatch):
+    """Descriptions are cached and invalidated when saving or deleting."""
+    monkeypatch.setattr(forms_module, "LABELS_CACHE", "default")
+    monkeypatch.setattr(forms_module, "_label_models", set())
+    caches["default"].clear()
+
+    file1 = File.objects.create(name="cached-1.txt")
+    file2 = File.objects.create(name="cached-2.txt")
+
+    pks = [str(file1.pk), file2.pk]
+    expected = {
+        f"testapp.file:{file1.pk}": "cached-1.txt",
+        f"testapp.file:{file2.pk}": "cached-2.txt",
+    }
+    assert resolve_foreign_key_descriptions(File, pks) == expected
+
+    with CaptureQueriesContext(connection) as ctx:
+        assert resolve_foreign_key_descriptions(File, pks) == expected
+    assert len(ctx) == 0
+
+    # Descriptions are cached per language
+    with translation.override("de"), CaptureQueriesContext(connection) as ctx:
+        assert resolve_foreign_key_descriptions(File, pks) == expected
+    assert len(ctx) == 1
+
+    # Only the referenced models are observed
+    assert signals.post_save.has_listeners(File)
+    assert not signals.post_save.has_listeners(Article)
+
+    file1.name = "renamed.txt"
+    file1.save()
+    file2.delete()
+    for language in ("en", "de"):
+        with translation.override(language):
+            with CaptureQueriesContext(connection) as ctx:
+                assert resolve_foreign_key_descriptions(File, pks) == {
+                    f"testapp.file:{file1.pk}": "renamed.txt",
+                }
+            assert len(ctx) == 1
+
+
+@pytest.mark.django_db
+def test_foreign_key_descriptions_view(admin_client, client):
+    """The descriptions endpoint resolves many keys in one request."""
+    file1 = File.objects.create(name="file-1.png")
+    file2 = File.objects.create(name="file-2.png")
+    url = "/json-schema-editor/foreign-key-descriptions/"
+    query = {
+        "key": [
+            f"testapp.file:{file1.pk}",
+            f"testapp.file:{file2.pk}",
+            "testapp.file:asdf",
+            "testapp.file:-1",
+            "testapp.unknown:1",
+            "nonsense",
+        ]
+    }
+
+    with CaptureQueriesContext(connection) as ctx:
+        response = admin_client.get(url, query)
+    assert response.json() == {
+        f"testapp.file:{file1.pk}": "file-1.png",
+        f"testapp.file:{file2.pk}": "file-2.png",
+    }
+    assert len([q for q in ctx if 'FROM "testapp_file"' in q["sql"]]) == 1
+
+    # Staff members only
+    response = client.get(url, query)
+    assert response.status_code == 302
+
+    # Users need the view permission
+    staff = User.objects.create_user("staff", "staff@example.com", "password")
+    staff.is_staff = True
+    staff.save()
+    client.force_login(staff)
+    assert client.get(url, query).json() == {}
+
+
+@pytest.mark.django_db
+def test_widget_renders_foreign_key_descriptions_url(admin_client):
+    response = admin_client.get("/admin/testapp/thing/add/")
+    assert (
+        'data-foreign-key-url="/json-schema-editor/foreign-key-descriptions/"'
+        in response.content.decode()
+    )
+
+
+@pytest.mark.django_db
+def test_editor_config_url(admin_client, client, monkeypatch):
+    """Editor configurations are served under content-hashed URLs."""
+    monkeypatch.setattr(forms_module, "CONFIG_CACHE", "default")
+    monkeypatch.setattr(forms_module, "_editor_configs", {})
+    caches["default"].clear()
+
+    response = admin_client.get("/admin/testapp/thing/add/")
+    content = response.content.decode()
+    assert "data-editor-config=" not in content
+    url = re.search(r'data-editor-config-url="([^"]+)"', content)[1]
+    key = url.rsplit("/", 1)[1].removesuffix(".json")
+
+    response = admin_client.get(url)
+    assert response.status_code == 200
+    assert response["ETag"] == f'"{key}"'
+    assert "immutable" in response["Cache-Control"]
+    assert response.json()["schema"] == Thing._meta.get_field("data")._schema
+
+    response = admin_client.get(url, headers={"if-none-match": f'"{key}"'})
+    assert response.status_code == 304
+
+    # Other processes find the configuration in the cache
+    monkeypatch.setattr(forms_module, "_editor_configs", {})
+    assert admin_client.get(url).status_code == 200
+
+    assert admin_client.get(url.replace(key, "0" * 64)).status_code == 404
+    assert client.get(url).status_code == 302
+
+    # Only content hashes are routed to the view
+    for invalid in ("0" * 63, "0" * 65, "g" * 64, "../" + key):
+        with pytest.raises(Resolver404):
+            resolve(url.replace(key, invalid))
+
+
+def test_widget_lazy_init(monkeypatch):
+    widget = forms_module.JSONEditorWidget()
+    assert "data-lazy" not in widget.render("data", "{}")
+
+    widget = forms_module.JSONEditorWidget(lazy=True)
+    assert "data-lazy" in widget.render("data", "{}")
+
+    monkeypatch.setattr(forms_module, "LAZY_INIT", True)
+    assert forms_module.JSONEditorWidget().lazy
+    assert not forms_module.JSONEditorWidget(lazy=False).lazy
+
+
+def test_widget_media_loads_editor_lazily():
+    """The json-editor bundle is only referenced from the import map."""
+    with translation.override("de"):
+        media = str(forms_module.JSONEditorWidget().media)
+    assert '<script src="/static/django_json_schema_editor/vendor' not in media
+    assert (
+        '"django-json-schema-editor/jsoneditor": '
+        '"/static/django_json_schema_editor/vendor/jsoneditor.js"' in media
+    )
+    assert (
+        '"django-json-schema-editor/language": '
+        '"/static/django_json_schema_editor/language_de.js"' in media
+    )
+    assert 'src="/static/django_json_schema_editor/widget.js" type="module"' in media
+    assert '"django-json-schema-editor/windowed-array"' in media
+
+    with translation.override("en"):
+        media = str(forms_module.JSONEditorWidget().media)
+    assert "django-json-schema-editor/language" not in media
+
+
+def test_apply_patch():
+    document = {"a": 1, "b": [1, 2, 3], "x/y": {}}
+    operations = [
+        {"op": "replace", "path": "/a", "value": 2},
+        {"op": "replace", "path": "/b/1", "value": 5},
+        {"op": "remove", "path": "/b/2"},
+        {"op": "add", "path": "/c", "value": None},
+        {"op": "add", "path": "/x~1y/z", "value": 1},
+        {"op": "add", "path": "/b/-", "value": 6},
+        {"op": "copy", "from": "/b", "path": "/d"},
+        {"op": "move", "from": "/d/0", "path": "/e"},
+        {"op": "test", "path": "/e", "value": 1},
+    ]
+    assert apply_patch(document, operations) == {
+        "a": 2,
+        "b": [1, 5, 6],
+        "c": None,
+        "d": [5, 6],
+        "e": 1,
+        "x/y": {"z": 1},
+    }
+    # The document itself is left alone
+    assert document == {"a": 1, "b": [1, 2, 3], "x/y": {}}
+
+    assert changed_paths(operations) == [[]]
+    assert changed_paths(operations[:3]) == [["a"], ["b"]]
+
+    for operations in [
+        {},
+        [{"op": "remove", "path": "/missing"}],
+        [{"op": "add", "path": "/b/7", "value": 1}],
+        [{"op": "add", "path": "/b/01", "value": 1}],
+        [{"op": "replace", "path": "/a"}],
+        [{"op": "test", "path": "/a", "value": 2}],
+        [{"op": "move", "from": "/b", "path": "/b/0"}],
+        [{"op": "unknown", "path": "/a"}],
+        [{"op": "add", "path": "a", "value": 1}],
+    ]:
+        with pytest.raises(JSONPatchError):
+            apply_patch(document, operations)
+
+
+def test_subschema():
+    schema = {
+        "type": "object",
+        "definitions": {"text": {"type": "string"}},
+        "properties": {
+            "items": {"type": "array", "items": {"$ref": "#/definitions/text"}},
+            "choice": {"oneOf": [{"type": "string"}, {"type": "integer"}]},
+        },
+    }
+    assert subschema(schema, ["items", "3"]) == {
+        "type": "string",
+        "definitions": {"text": {"type": "string"}},
+    }
+    assert subschema(schema, ["choice"]) is None
+    assert subschema(schema, ["unknown"]) is None
+    assert subschema(schema, []) == schema
+
+    # The dialect is kept, parents constraining their children aren't skipped
+    schema = {
+        "$schema": "http://json-schema.org/draft-07/schema#",
+        "type": "object",
+        "properties": {
+            "tags": {"type": "array", "items": {"type": "string"}},
+            "unique": {
+                "type": "array",
+                "items": {"type": "string"},
+                "uniqueItems": True,
+            },
+        },
+        "required": ["tags"],
+    }
+    assert subschema(schema, ["tags"]) is None
+    del schema["required"]
+    assert subschema(schema, ["tags", "0"]) == {
+        "type": "string",
+        "$schema": "http://json-schema.org/draft-07/schema#",
+    }
+    assert subschema(schema, ["unique"])["uniqueItems"]
+    assert subschema(schema, ["unique", "0"]) is None
+
+
+def test_json_patch_submission():
+    schema = {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string", "maxLength": 10},
+            "count": {"type": "integer"},
+            "tags": {"type": "array", "items": {"type": "string"}},
+        },
+    }
+
+    class Form(forms.Form):
+        data = forms_module.JSONEditorField(schema=schema, patch=True)
+
+    # The stored count is invalid, but only changed parts are validated
+    initial = {"title": "Hello", "count": "invalid", "tags": ["a"]}
+    base = json_fingerprint(initial)
+
+    html = str(Form(initial={"data": initial})["data"])
+    assert f'data-patch-base="{base}"' in html
+
+    def submit(operations, base=base):
+        return Form(
+            {"data": json.dumps(operations), "data-patch-base": base},
+            initial={"data": initial},
+        )
+
+    form = submit([{"op": "add", "path": "/tags/-", "value": "b"}])
+    assert form.is_valid(), form.errors
+    assert form.cleaned_data["data"] == {
+        "title": "Hello",
+        "count": "invalid",
+        "tags": ["a", "b"],
+    }
+    assert form.has_changed()
+    assert not submit([]).has_changed()
+
+    form = submit([{"op": "add", "path": "/tags/-", "value": 1}])
+    assert not form.is_valid()
+
+    form = submit([{"op": "replace", "path": "/title", "value": "Too long title"}])
+    assert not form.is_valid()
+    # The patched document is rendered again, without offering a patch
+    assert "Too long title" in str(form["data"])
+    assert "data-patch-base" not in str(form["data"])
+
+    # Changing a part which cannot be validated on its own validates everything
+    form = submit([{"op": "add", "path": "/other", "value": 1}])
+    assert not form.is_valid()
+
+    form = submit([{"op": "remove", "path": "/missing"}])
+    assert "Invalid JSON Patch" in str(form.errors)
+
+    form = submit([], base="stale")
+    assert "changed by someone else" in str(form.errors)
+
+    # Parents constraining their children are validated as a whole
+    schema = {
+        "type": "object",
+        "properties": {
+            "tags": {"type": "array", "items": {"type": "string"}, "uniqueItems": True},
+        },
+    }
+
+    class UniqueForm(forms.Form):
+        data = forms_module.JSONEditorField(schema=schema, patch=True)
+
+    class FullForm(forms.Form):
+        data = forms_module.JSONEditorField(schema=schema)
+
+    initial = {"tags": ["a", "b"]}
+    operations = [{"op": "replace", "path": "/tags/1", "value": "a"}]
+    data = {
+        "data": json.dumps(operations),
+        "data-patch-base": json_fingerprint(initial),
+    }
+    form = UniqueForm(data, initial={"data": initial})
+    assert not form.is_valid()
+    assert "must contain unique items" in str(form.errors)
+
+    # Fields which didn't opt in never accept patches
+    form = FullForm(data, initial={"data": initial})
+    assert not form.is_valid()
+    assert "must be object" in str(form.errors)
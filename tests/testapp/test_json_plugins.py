@@ -1,12 +1,35 @@
 """Tests for JSON path support in JSONPluginBase."""
 
+import copy
+import json
+import re
 from unittest.mock import MagicMock, patch
 
+import jmespath
 import pytest
+from django.contrib.admin import site as admin_site
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connection
+from django.db.models.query_utils import DeferredAttribute
+from django.forms.models import inlineformset_factory
+from django.test.utils import CaptureQueriesContext
 from django.utils.translation import gettext_lazy as _
 from playwright.sync_api import expect
 
-from django_json_schema_editor.plugins import JSONPluginBase
+from django_json_schema_editor.apps import referenced_models
+from django_json_schema_editor.fields import (
+    _reference_listeners,
+    foreign_key_extractors,
+    paths_to_pks,
+)
+from django_json_schema_editor.plugins import (
+    JSONPluginBase,
+    JSONPluginInline,
+    JSONPluginInlineFormSet,
+)
+from django_json_schema_editor.validation import json_fingerprint
 from testapp import models
 from testapp.test_json_editor import login_admin
 
@@ -364,6 +387,32 @@ def test_proxy_with_meta_parameter():
     assert ProxyPlugin._meta.ordering == ["-id"]
 
 
+def test_proxy_compiles_expressions():
+    """Expressions are compiled once when creating the proxy."""
+    ProxyPlugin = models.JSONPlugin.proxy(
+        "test_compiled",
+        schema={"type": "object", "__str__": "title"},
+        foreign_key_paths={"testapp.file": ["file", "files[*]"]},
+    )
+
+    assert ProxyPlugin._str_expression.expression == "title"
+    expressions = models.JSONPlugin._proxy_types_foreign_key_paths["test_compiled"]
+    assert [e.expression for e in expressions["testapp.file"]] == ["file", "files[*]"]
+    assert str(ProxyPlugin(data={"title": "Compiled"})) == "Compiled"
+    assert paths_to_pks(
+        {"file": 1, "files": [2, 3]}, to=models.File, paths=expressions["testapp.file"]
+    ) == [1, 2, 3]
+
+    with pytest.raises(jmespath.exceptions.ParseError):
+        models.JSONPlugin.proxy("test_invalid_str", schema={"__str__": "title["})
+    with pytest.raises(jmespath.exceptions.ParseError):
+        models.JSONPlugin.proxy(
+            "test_invalid_paths",
+            schema={},
+            foreign_key_paths={"testapp.file": ["[?"]},
+        )
+
+
 @pytest.mark.django_db
 def test_proxy_mixin_with_properties():
     """Test that mixin can add properties to proxy class."""
@@ -413,3 +462,538 @@ def test_proxy_mixin_access_to_schema_and_type():
 
     assert plugin.get_schema_title() == "Test Schema"
     assert plugin.get_type_name() == "test_access"
+
+
+@pytest.mark.django_db
+def test_reference_sync_queries():
+    """Reference sync runs a constant number of queries."""
+    ProxyPlugin = models.JSONPlugin.proxy(
+        "test_many_files",
+        schema={"type": "object"},
+        foreign_key_paths={"testapp.file": ["files"]},
+    )
+    files = [models.File.objects.create(name=f"file-{i}") for i in range(150)]
+    article = models.Article.objects.create()
+
+    plugin = ProxyPlugin(
+        parent=article,
+        region="main",
+        ordering=10,
+        data={"files": [file.pk for file in files[:100]] + ["asdf", -1, None]},
+    )
+    with CaptureQueriesContext(connection) as ctx:
+        plugin.save()
+    # INSERT, existence check, reference rows and bulk_create
+    assert len(ctx) == 4
+    assert {file.pk for file in plugin.files.all()} == {file.pk for file in files[:100]}
+
+    plugin.data["files"] = [file.pk for file in files[50:]]
+    with CaptureQueriesContext(connection) as ctx:
+        plugin.save()
+    # UPDATE, existence check, reference rows, delete and bulk_create
+    assert len(ctx) == 5
+    assert {file.pk for file in plugin.files.all()} == {file.pk for file in files[50:]}
+
+
+def test_reference_listeners_are_sender_scoped():
+    """Only models with registered references get post_save receivers."""
+    ProxyPlugin = models.JSONPlugin.proxy("test_listeners", schema={"type": "object"})
+
+    assert models.File not in _reference_listeners
+    assert models.Article not in _reference_listeners
+    assert len(_reference_listeners[models.Thing]) == 1
+    assert len(_reference_listeners[models.JSONPlugin]) == 1
+    assert len(_reference_listeners[models.Download]) == 1
+    assert _reference_listeners[ProxyPlugin] == _reference_listeners[models.Text]
+
+
+@pytest.mark.django_db
+def test_unchanged_data_skips_references():
+    """Saving and validating unchanged data doesn't touch the references."""
+    file = models.File.objects.create(name="test.png")
+    article = models.Article.objects.create()
+    models.Download.objects.create(
+        parent=article, region="main", ordering=10, data={"file": file.pk}
+    )
+
+    plugin = models.JSONPlugin.objects.downcast().get()
+    with CaptureQueriesContext(connection) as ctx:
+        plugin.full_clean()
+        plugin.ordering = 20
+        plugin.save()
+    # The parent foreign key validation and the UPDATE
+    assert len(ctx) == 2
+
+    plugin.data["file"] = -1
+    with pytest.raises(ValidationError):
+        plugin.full_clean()
+    plugin.save()
+    assert not plugin.files.exists()
+
+    # Saving again doesn't sync again
+    with CaptureQueriesContext(connection) as ctx:
+        plugin.save()
+    assert len(ctx) == 1
+
+
+@pytest.mark.django_db
+def test_data_fingerprints_are_lazy():
+    """Fingerprints are only taken when the data is accessed."""
+    files = [models.File.objects.create(name=f"file-{i}.png") for i in range(2)]
+    article = models.Article.objects.create()
+    for i in range(3):
+        models.Download.objects.create(
+            parent=article, region="main", ordering=i, data={"file": files[0].pk}
+        )
+
+    with patch(
+        "django_json_schema_editor.fields.json_fingerprint", wraps=json_fingerprint
+    ) as mock:
+        plugins = list(models.JSONPlugin.objects.downcast())
+        plugins[0].ordering = 20
+        plugins[0].save()
+        assert not mock.called
+
+        # Replacing data which hasn't been accessed yet is detected too
+        plugins[1].data = {"file": files[1].pk}
+        plugins[1].save()
+        assert [file.pk for file in plugins[1].files.all()] == [files[1].pk]
+
+        assert plugins[2].data["file"] == files[0].pk
+        assert mock.call_count == 3
+
+    # Models without references do not track accesses
+    assert type(models.Playlist.__dict__["data"]) is DeferredAttribute
+    assert isinstance(models.JSONPlugin.__dict__["data"], DeferredAttribute)
+    assert type(models.JSONPlugin.__dict__["data"]) is not DeferredAttribute
+
+
+@pytest.mark.django_db
+def test_formset_batches_reference_validation():
+    """Reference validation runs one query per target model for all forms."""
+    files = [models.File.objects.create(name=f"file-{i}") for i in range(3)]
+    article = models.Article.objects.create()
+
+    FormSet = inlineformset_factory(
+        models.Article,
+        models.Download,
+        formset=JSONPluginInlineFormSet,
+        fields=["data", "region", "ordering"],
+        extra=0,
+    )
+    data = {
+        "testapp_jsonplugin_set-TOTAL_FORMS": "4",
+        "testapp_jsonplugin_set-INITIAL_FORMS": "0",
+    }
+    for i, pk in enumerate([*(file.pk for file in files), -1]):
+        data |= {
+            f"testapp_jsonplugin_set-{i}-data": json.dumps({"file": pk}),
+            f"testapp_jsonplugin_set-{i}-region": "main",
+            f"testapp_jsonplugin_set-{i}-ordering": str(i),
+        }
+
+    formset = FormSet(data, instance=article)
+    with CaptureQueriesContext(connection) as ctx:
+        assert not formset.is_valid()
+    assert len([q for q in ctx if "testapp_file" in q["sql"]]) == 1
+
+    assert [bool(form.errors) for form in formset] == [False, False, False, True]
+    assert "Some of the references are invalid: -1" in str(formset[3].errors)
+
+
+@pytest.mark.django_db
+def test_admin_resolves_foreign_key_descriptions_once(admin_client):
+    """Foreign key descriptions of all inline forms are resolved at once."""
+    article = models.Article.objects.create()
+    for i in range(3):
+        models.Download.objects.create(
+            parent=article,
+            region="main",
+            ordering=i,
+            data={"file": models.File.objects.create(name=f"file-{i}.png").pk},
+        )
+    models.Download.objects.create(
+        parent=article, region="main", ordering=10, data={"file": "invalid"}
+    )
+
+    with CaptureQueriesContext(connection) as ctx:
+        response = admin_client.get(f"/admin/testapp/article/{article.pk}/change/")
+    assert len([q for q in ctx if 'FROM "testapp_file"' in q["sql"]]) == 1
+    for i in range(3):
+        assert f"file-{i}.png" in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_admin_emits_editor_configs_once(admin_client):
+    """Each distinct editor configuration is only emitted once per page."""
+    article = models.Article.objects.create()
+    for i in range(3):
+        models.Download.objects.create(
+            parent=article, region="main", ordering=i, data={"file": None}
+        )
+
+    response = admin_client.get(f"/admin/testapp/article/{article.pk}/change/")
+    content = response.content.decode()
+    config_ids = set(re.findall(r'data-editor-config-id="([^"]+)"', content))
+    assert config_ids
+    assert "data-editor-config=" not in content
+    for config_id in config_ids:
+        assert content.count(f'<script id="{config_id}"') == 1
+
+
+def test_foreign_key_extractors():
+    """Foreign keys are found in nested, recursive and referenced schemas."""
+    file = {
+        "type": "string",
+        "format": "foreign_key",
+        "options": {"model": "testapp.file"},
+    }
+    schema = {
+        "definitions": {
+            "node": {
+                "type": "object",
+                "properties": {
+                    "file": file,
+                    "children": {
+                        "type": "array",
+                        "items": {"$ref": "#/definitions/node"},
+                    },
+                },
+            },
+        },
+        "type": "object",
+        "properties": {
+            "tree": {"$ref": "#/definitions/node"},
+            "gallery": {"type": "array", "items": file},
+            "article": {
+                "format": "foreign_key",
+                "options": {"model": "testapp.article"},
+            },
+        },
+    }
+    extractors = foreign_key_extractors(schema)
+    assert set(extractors) == {"testapp.file", "testapp.article"}
+    assert foreign_key_extractors(copy.deepcopy(schema)) == extractors
+
+    data = {
+        "tree": {"file": 1, "children": [{"file": 2, "children": [{"file": 3}]}, {}]},
+        "gallery": [4, None, 1, {"invalid": True}],
+        "article": 5,
+        "unknown": {"file": 6},
+    }
+    assert extractors["testapp.file"](data) == [1, 2, 3, 4]
+    assert extractors["testapp.article"](data) == [5]
+    assert extractors["testapp.file"](None) == []
+
+    # Models which aren't installed are skipped
+    assert (
+        foreign_key_extractors(
+            {
+                "type": "string",
+                "format": "foreign_key",
+                "options": {"model": "media.image"},
+            }
+        )
+        == {}
+    )
+
+
+@pytest.mark.django_db
+def test_schema_derived_references():
+    """Plugins without foreign_key_paths use the foreign keys in the schema."""
+    ProxyPlugin = models.JSONPlugin.proxy(
+        "test_schema_files",
+        schema={
+            "type": "object",
+            "properties": {
+                "items": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "file": {
+                                "type": "string",
+                                "format": "foreign_key",
+                                "options": {"model": "testapp.file"},
+                            },
+                            "image": {
+                                "type": "string",
+                                "format": "foreign_key",
+                                "options": {"model": "media.image"},
+                            },
+                        },
+                    },
+                },
+            },
+        },
+        schema_foreign_keys=True,
+    )
+    files = [models.File.objects.create(name=f"file-{i}.png") for i in range(3)]
+    article = models.Article.objects.create()
+    plugin = ProxyPlugin.objects.create(
+        parent=article,
+        region="main",
+        ordering=10,
+        data={"items": [{"file": file.pk, "image": 1} for file in files[:2]]},
+    )
+    assert {file.pk for file in plugin.files.all()} == {files[0].pk, files[1].pk}
+
+    # Models which aren't installed are skipped
+    inline = JSONPluginInline.create(ProxyPlugin)(models.Article, admin_site)
+    field = inline.formfield_for_dbfield(ProxyPlugin._meta.get_field("data"), None)
+    ((label, getter),) = field._foreign_key_descriptions
+    assert label == "testapp.file"
+    assert getter(plugin.data) == [files[0].pk, files[1].pk]
+    assert models.File in set(referenced_models())
+
+
+@pytest.mark.django_db
+def test_schema_foreign_keys_are_opt_in():
+    """Proxies only use the foreign keys found in the schema if asked to."""
+    ProxyPlugin = models.JSONPlugin.proxy(
+        "test_schema_opt_out",
+        schema={
+            "type": "object",
+            "properties": {
+                "file": {
+                    "type": "string",
+                    "format": "foreign_key",
+                    "options": {"model": "testapp.file"},
+                },
+            },
+        },
+    )
+    file = models.File.objects.create(name="file.png")
+    plugin = ProxyPlugin.objects.create(
+        parent=models.Article.objects.create(),
+        region="main",
+        ordering=10,
+        data={"file": file.pk},
+    )
+    assert not plugin.files.exists()
+    file.delete()
+
+    inline = JSONPluginInline.create(ProxyPlugin)(models.Article, admin_site)
+    field = inline.formfield_for_dbfield(ProxyPlugin._meta.get_field("data"), None)
+    assert field._foreign_key_descriptions == []
+
+
+@pytest.mark.django_db
+def test_labeled_plugins():
+    """Labels are stored when saving and used without loading the data."""
+    article = models.Article.objects.create()
+    term = models.Term.objects.create(
+        parent=article, region="main", ordering=10, data={"term": "Zebra"}
+    )
+    empty = models.Term.objects.create(
+        parent=article, region="main", ordering=20, data={}
+    )
+    assert term.label == "Zebra"
+    assert empty.label == "Term"
+
+    with CaptureQueriesContext(connection) as ctx:
+        labels = [
+            str(plugin)
+            for plugin in models.LabeledJSONPlugin.objects.defer("data").order_by(
+                "label"
+            )
+        ]
+    assert labels == ["Term", "Zebra"]
+    assert len(ctx) == 1
+
+    term.data["term"] = "Aardvark"
+    term.save(update_fields=["data"])
+    assert models.LabeledJSONPlugin.objects.get(pk=term.pk).label == "Aardvark"
+
+    models.LabeledJSONPlugin.objects.update(label="")
+    models.LabeledJSONPlugin.update_labels()
+    assert list(
+        models.LabeledJSONPlugin.objects.order_by("label").values_list(
+            "label", flat=True
+        )
+    ) == ["Aardvark", "Term"]
+
+
+@pytest.mark.django_db
+def test_admin_loads_plugins_once(admin_client):
+    """The plugins of all JSON plugin inlines are loaded with one query."""
+    article = models.Article.objects.create()
+    models.Text.objects.create(
+        parent=article, region="main", ordering=10, data={"text": "first"}
+    )
+    models.Text.objects.create(
+        parent=article, region="main", ordering=20, data={"text": "second"}
+    )
+    models.Download.objects.create(
+        parent=article, region="main", ordering=30, data={"file": None}
+    )
+    # Plugins of unknown types are ignored
+    models.JSONPlugin.objects.bulk_create(
+        [
+            models.JSONPlugin(
+                parent=article, region="main", ordering=40, type="unknown", data={}
+            )
+        ]
+    )
+
+    with CaptureQueriesContext(connection) as ctx:
+        response = admin_client.get(f"/admin/testapp/article/{article.pk}/change/")
+    assert len([q for q in ctx if 'FROM "testapp_jsonplugin"' in q["sql"]]) == 1
+
+    formsets = {
+        formset.formset.model: formset.formset
+        for formset in response.context["inline_admin_formsets"]
+    }
+    assert [
+        form.instance.data["text"] for form in formsets[models.Text].initial_forms
+    ] == ["first", "second"]
+    assert len(formsets[models.Download].initial_forms) == 1
+    assert type(formsets[models.Download].initial_forms[0].instance) is (
+        models.Download
+    )
+
+
+@pytest.mark.django_db
+def test_admin_plugin_loader_respects_permissions(client, django_user_model):
+    """Users without the view or change permission do not see plugin data."""
+    article = models.Article.objects.create()
+    models.Text.objects.create(
+        parent=article, region="main", ordering=10, data={"text": "SECRET TEXT"}
+    )
+
+    user = django_user_model.objects.create_user("editor", is_staff=True)
+    user.user_permissions.set(
+        Permission.objects.get(
+            content_type=ContentType.objects.get_for_model(
+                model, for_concrete_model=False
+            ),
+            codename=codename,
+        )
+        for model, codename in [
+            (models.Article, "change_article"),
+            (models.Text, "add_jsonplugin_text"),
+            (models.Download, "add_jsonplugin_file"),
+        ]
+    )
+    client.force_login(user)
+
+    response = client.get(f"/admin/testapp/article/{article.pk}/change/")
+    assert response.status_code == 200
+    assert "SECRET TEXT" not in response.content.decode()
+    for formset in response.context["inline_admin_formsets"]:
+        assert not formset.formset.initial_forms
+
+
+@pytest.mark.django_db
+def test_downcast_hints():
+    """Proxy types declare lookups to prefetch and fields to defer."""
+    Gallery = models.JSONPlugin.proxy(
+        "test_gallery",
+        schema={
+            "type": "object",
+            "properties": {
+                "file": {
+                    "type": "string",
+                    "format": "foreign_key",
+                    "options": {"model": "testapp.file"},
+                },
+            },
+        },
+        prefetch_related=["files"],
+        schema_foreign_keys=True,
+    )
+    Note = models.JSONPlugin.proxy(
+        "test_note",
+        schema={"type": "object"},
+        defer=["data"],
+    )
+    with pytest.raises(FieldDoesNotExist):
+        models.JSONPlugin.proxy("test_invalid", schema={}, defer=["unknown"])
+
+    article = models.Article.objects.create()
+    for i in range(3):
+        file = models.File.objects.create(name=f"file-{i}.png")
+        Gallery.objects.create(
+            parent=article, region="main", ordering=i, data={"file": file.pk}
+        )
+        Note.objects.create(
+            parent=article, region="main", ordering=i, data={"text": "note"}
+        )
+
+    queryset = models.JSONPlugin.objects.filter(parent=article).order_by("pk")
+    with CaptureQueriesContext(connection) as ctx:
+        plugins = list(queryset.downcast(listing=True))
+        galleries = [plugin for plugin in plugins if type(plugin) is Gallery]
+        assert [[file.name for file in plugin.files.all()] for plugin in galleries] == [
+            ["file-0.png"],
+            ["file-1.png"],
+            ["file-2.png"],
+        ]
+        assert all(plugin.data["file"] for plugin in galleries)
+    assert len(ctx) == 2
+    assert [type(plugin) for plugin in plugins] == [Gallery, Note] * 3
+    assert all(
+        plugin.get_deferred_fields() == {"data"}
+        for plugin in plugins
+        if type(plugin) is Note
+    )
+
+    with CaptureQueriesContext(connection) as ctx:
+        plugins = list(queryset.downcast().iterator(chunk_size=2))
+    assert len(ctx) == 4
+    assert [plugin.data for plugin in plugins if type(plugin) is Note] == [
+        {"text": "note"}
+    ] * 3
+
+
+@pytest.mark.django_db
+def test_prefetch_json_references():
+    """Referenced objects of all plugins are loaded with one query per model."""
+    Gallery = models.JSONPlugin.proxy(
+        "test_reference_gallery",
+        schema={
+            "type": "object",
+            "properties": {
+                "files": {
+                    "type": "array",
+                    "items": {
+                        "type": "string",
+                        "format": "foreign_key",
+                        "options": {"model": "testapp.file"},
+                    },
+                },
+            },
+        },
+        schema_foreign_keys=True,
+    )
+    files = [models.File.objects.create(name=f"file-{i}.png") for i in range(3)]
+    article = models.Article.objects.create()
+    models.Download.objects.create(
+        parent=article, region="main", ordering=10, data={"file": files[0].pk}
+    )
+    models.Download.objects.create(
+        parent=article, region="main", ordering=20, data={"file": "invalid"}
+    )
+    Gallery.objects.create(
+        parent=article,
+        region="main",
+        ordering=30,
+        data={"files": [files[2].pk, files[1].pk]},
+    )
+    models.Text.objects.create(
+        parent=article, region="main", ordering=40, data={"text": "Hello"}
+    )
+
+    with CaptureQueriesContext(connection) as ctx:
+        plugins = list(
+            models.JSONPlugin.objects.filter(parent=article)
+            .order_by("ordering")
+            .prefetch_json_references()
+        )
+    assert len(ctx) == 2
+    assert [plugin.json_references for plugin in plugins] == [
+        {"file": [files[0]]},
+        {"file": []},
+        {"testapp.file": [files[2], files[1]]},
+        {},
+    ]